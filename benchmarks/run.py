@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""
+Benchmarks comparing pypedream pipelines to equivalent shell pipelines
+and hand-written subprocess code.
+
+    ./benchmarks/run.py                         # run, print a table
+    ./benchmarks/run.py --save results.json     # also store the results
+    ./benchmarks/run.py --compare results.json  # fail on regressions
+
+Synthetic inputs are generated in the work directory, once per size.
+"""
+# pypedream pypelines look like pointless statements
+# pylint: disable=W0104, W0106
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import pathlib
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+import pypedream as pyd
+
+SIZES = {
+    'small': 10 ** 3,
+    'medium': 10 ** 5,
+    'large': 10 ** 6,
+}
+WORDS = ['alpha', 'beta', 'gamma', 'delta', 'epsilon', 'zeta', 'eta']
+
+
+def generate(workdir, size, n_lines):
+    """ Writes the plain and gzipped input files for one size """
+    path = workdir / '{}.txt'.format(size)
+    gz_path = workdir / '{}.txt.gz'.format(size)
+    if not path.exists():
+        rng = random.Random(n_lines)
+        with open(path, 'w') as fobj:
+            for i in range(n_lines):
+                fobj.write('{}\t{}\t{}\n'.format(
+                    i, rng.choice(WORDS), rng.randint(0, 10 ** 6)))
+    if not gz_path.exists():
+        with open(path, 'rb') as inp, gzip.open(gz_path, 'wb') as out:
+            out.write(inp.read())
+    return path, gz_path
+
+
+def prefix(lines):
+    for line in lines:
+        yield '_ ' + line
+
+
+# hand-written equivalent of the mixed pipeline, in the style of old_pipe.py
+def handwritten_mixed(inp_path, out_path):
+    with open(inp_path, 'r') as inp, open(out_path, 'w') as out:
+        proc1 = subprocess.Popen(
+            ['cut', '-f', '2'], stdin=inp, stdout=subprocess.PIPE,
+            universal_newlines=True, bufsize=-1)
+        proc2 = subprocess.Popen(
+            ['sort'], stdin=subprocess.PIPE, stdout=out,
+            universal_newlines=True, bufsize=-1)
+
+        def shovel():
+            with proc2.stdin:
+                for line in prefix(proc1.stdout):
+                    proc2.stdin.write(line)
+        thread = threading.Thread(target=shovel)
+        thread.start()
+        proc1.wait()
+        thread.join()
+        proc2.wait()
+
+
+def bash(commandline):
+    subprocess.run(['bash', '-c', commandline], check=True)
+
+
+def cases(path, gz_path, out, jobs, spawn_command):
+    """ (name, number of stages, whether the case reads the input,
+    {variant: callable}) for one input size """
+    yield 'commands', 3, True, {
+        'pypedream': lambda: (
+            path >> pyd.Command('cut -f 2')
+            | pyd.Command('sort')
+            | pyd.Command('uniq -c') >> out),
+        'async': lambda: asyncio.run((
+            pyd.Command('cut -f 2') | pyd.Command('sort')
+            | pyd.Command('uniq -c')).run_async(path, out)),
+        'bash': lambda: bash(
+            "cut -f 2 < '{}' | sort | uniq -c > '{}'".format(path, out)),
+    }
+    yield 'mixed', 3, True, {
+        'pypedream': lambda: (
+            path >> pyd.Command('cut -f 2')
+            | pyd.Function(prefix)
+            | pyd.Command('sort') >> out),
+        'handwritten': lambda: handwritten_mixed(path, out),
+        'bash': lambda: bash(
+            "cut -f 2 < '{}' | sed 's/^/_ /' | sort > '{}'".format(
+                path, out)),
+    }
+    yield 'function', 1, True, {
+        'pypedream': lambda: path >> pyd.Function(prefix) >> out,
+        'bash': lambda: bash(
+            "sed 's/^/_ /' < '{}' > '{}'".format(path, out)),
+    }
+    yield 'compressed', 1, True, {
+        'pypedream': lambda: gz_path >> pyd.Command('wc -l') >> out,
+        'python-codec': lambda: (
+            gz_path >> pyd.Command('wc -l').configure(compression='python')
+            >> out),
+        'bash': lambda: bash(
+            "gzip -dc '{}' | wc -l > '{}'".format(gz_path, out)),
+    }
+    yield 'parallel', jobs, False, {
+        'pypedream': lambda: run_parallel(jobs),
+        'pypedream-max-jobs': lambda: run_parallel(jobs, os.cpu_count()),
+        'spawn-max-jobs': lambda: run_parallel(
+            jobs, os.cpu_count(), launcher='spawn'),
+        'bash': lambda: bash(
+            'for i in $(seq {}); do true & done; wait'.format(jobs)),
+    }
+    yield 'spawn', jobs, False, {
+        'popen': lambda: run_sequential(jobs, spawn_command),
+        'spawn': lambda: run_sequential(
+            jobs, spawn_command, launcher='spawn'),
+        # e.g. true is a bash builtin unless disabled
+        'bash': lambda: bash('enable -n {0} 2> /dev/null; '
+                             'for i in $(seq {1}); do {2} > /dev/null; '
+                             'done'.format(spawn_command.split()[0], jobs,
+                                           spawn_command)),
+    }
+
+
+def run_parallel(jobs, max_jobs=None, launcher='popen'):
+    true = pyd.Command('true', launcher=launcher)
+    with pyd.Parallel(max_jobs=max_jobs) as para:
+        for _ in range(jobs):
+            None >> true & para >> None
+
+
+def run_sequential(jobs, command, launcher='popen'):
+    """ Starts tiny commands one after the other """
+    command = pyd.Command(command, launcher=launcher)
+    for _ in range(jobs):
+        None >> command >> os.devnull
+
+
+def measure(func, repeat, out=None):
+    """ Median and minimum wall time of repeat runs, after a warmup run.
+    out is removed before each run: pypedream appends to it,
+    while bash truncates it. """
+    times = []
+    for i in range(repeat + 1):
+        if out is not None and out.exists():
+            out.unlink()
+        start = time.perf_counter()
+        func()
+        if i > 0:
+            times.append(time.perf_counter() - start)
+    return statistics.median(times), min(times)
+
+
+def run(args):
+    workdir = pathlib.Path(args.workdir or tempfile.mkdtemp(
+        prefix='pypedream-bench-'))
+    workdir.mkdir(parents=True, exist_ok=True)
+    out = workdir / 'out'
+    results = []
+    for size in args.sizes:
+        path, gz_path = generate(workdir, size, SIZES[size])
+        n_bytes = path.stat().st_size
+        for name, stages, reads, variants in cases(
+                path, gz_path, out, args.jobs, args.spawn_command):
+            if args.cases and name not in args.cases:
+                continue
+            timings = {variant: measure(func, args.repeat, out)
+                       for variant, func in variants.items()}
+            baseline = timings['bash'][0]
+            for variant, (median, best) in timings.items():
+                results.append({
+                    'case': name,
+                    'size': size,
+                    'variant': variant,
+                    'median': median,
+                    'min': best,
+                    'mb_per_s': n_bytes / median / 1e6 if reads else None,
+                    # e.g. commands started per second
+                    'runs_per_s': None if reads else stages / median,
+                    'overhead_per_stage': (median - baseline) / stages,
+                })
+    return results
+
+
+def print_table(results, previous=None):
+    header = '{:<11} {:<7} {:<19} {:>10} {:>10} {:>10} {:>12}'.format(
+        'case', 'size', 'variant', 'median ms', 'MB/s', 'runs/s',
+        'ovh/stage ms')
+    if previous is not None:
+        header += ' {:>8}'.format('vs prev')
+    print(header)
+    for result in results:
+        throughput = result['mb_per_s']
+        rate = result.get('runs_per_s')
+        line = '{case:<11} {size:<7} {variant:<19} {:>10.2f} {:>10} ' \
+               '{:>10} {:>12.2f}'.format(
+                   result['median'] * 1000,
+                   '-' if throughput is None else '{:.1f}'.format(throughput),
+                   '-' if rate is None else '{:.0f}'.format(rate),
+                   result['overhead_per_stage'] * 1000, **result)
+        if previous is not None:
+            ratio = ratio_to(previous, result)
+            line += ' {:>8}'.format(
+                '-' if ratio is None else '{:.2f}x'.format(ratio))
+        print(line)
+
+
+def _key(result):
+    return (result['case'], result['size'], result['variant'])
+
+
+def ratio_to(previous, result):
+    old = previous.get(_key(result))
+    if old is None:
+        return None
+    return result['median'] / old['median']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sizes', nargs='+', choices=list(SIZES),
+                        default=['small', 'medium'])
+    parser.add_argument('--cases', nargs='+', default=None,
+                        help='only run these cases')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--jobs', type=int, default=50,
+                        help='number of pipelines in the parallel '
+                             'and spawn cases')
+    parser.add_argument('--spawn-command', default='true',
+                        help='tiny command started in the spawn case, '
+                             'e.g. ./noinprog')
+    parser.add_argument('--workdir', default=None,
+                        help='where to generate the inputs '
+                             '(default: a new temporary directory)')
+    parser.add_argument('--save', default=None,
+                        help='write the results as JSON to this file')
+    parser.add_argument('--compare', default=None,
+                        help='JSON results of an earlier run')
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help='slowdown ratio counted as a regression')
+    args = parser.parse_args()
+
+    previous = None
+    if args.compare:
+        with open(args.compare) as fobj:
+            previous = {_key(result): result
+                        for result in json.load(fobj)['results']}
+    results = run(args)
+    print_table(results, previous)
+    if args.save:
+        with open(args.save, 'w') as fobj:
+            json.dump({
+                'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'cpus': os.cpu_count(),
+                'pypedream': pyd.__version__,
+                'results': results,
+            }, fobj, indent=2)
+    if previous is not None:
+        regressions = [
+            result for result in results
+            if result['variant'] not in ('bash', 'handwritten')
+            and (ratio_to(previous, result) or 0) > args.threshold]
+        for result in regressions:
+            print('REGRESSION: {case} {size} {variant} is {:.2f}x '
+                  'slower'.format(ratio_to(previous, result), **result),
+                  file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -19,4 +19,33 @@ def get_version():
 # when they are imported.
 # pylint: disable=C0413
 
+import importlib
+
 from .pypedream import *
+
+# names of the helper modules, imported on first use
+# to keep "import pypedream" fast
+_LAZY_NAMES = {
+    'Codec': 'compression',
+    'CODECS': 'compression',
+    'register_codec': 'compression',
+    'PipelineStats': 'stats',
+    'StageStats': 'stats',
+    'ResultCache': 'cache',
+    'RecordCodec': 'records',
+    'RECORD_CODECS': 'records',
+    'register_record_codec': 'records',
+    'ArrayFunction': 'arrays',
+}
+
+
+def __getattr__(name):
+    try:
+        module = _LAZY_NAMES[name]
+    except KeyError:
+        raise AttributeError(
+            'module {!r} has no attribute {!r}'.format(__name__, name))
+    value = getattr(importlib.import_module('.' + module, __name__), name)
+    # later lookups find the value directly
+    globals()[name] = value
+    return value
@@ -0,0 +1,135 @@
+"""
+Vectorized Function stages working on blocks of columns
+"""
+
+import importlib.util
+
+from .pypedream import Function, _LazyModule
+
+numpy = _LazyModule('numpy')
+
+# delimiters that numpy.fromstring handles as whitespace
+_WHITESPACE = (None, ' ', '\t')
+
+
+class ArrayFunction(Function):
+    """ A Function transforming blocks of lines as NumPy arrays.
+
+    The input is read in blocks of up to block_size lines, each parsed
+    into one array per column, e.g. for numeric TSV from cut:
+
+        def features(x, y):
+            return x * y, numpy.log1p(x)
+        cut | pyd.ArrayFunction(features) | sort
+
+    func is called once per block with the columns as arguments,
+    and returns the output columns: a 1-D array, a tuple or list of
+    1-D arrays, or a 2-D array with a row per line. They are formatted
+    back into lines in bulk, using the printf style fmt if given
+    (a str, or one per column), and joined by the delimiter.
+
+    dtype is the type of all columns, or a list with one per column.
+    Whitespace delimited numeric input is parsed by numpy directly,
+    other input is split into fields first.
+
+    Requires numpy, which is imported only when the first block
+    is parsed. Other arguments are as for Function. """
+    def __init__(self, func, block_size=10000, dtype=float, delimiter='\t',
+                 fmt=None, processes=None, ordered=True, version=None):
+        if importlib.util.find_spec('numpy') is None:
+            raise ImportError('ArrayFunction requires the numpy module')
+        super().__init__(
+            ArrayBlocks(func, dtype, delimiter, fmt),
+            batch=block_size, processes=processes, chunk_size=block_size,
+            ordered=ordered, version=version)
+
+
+class ArrayBlocks():
+    """ The batched func of an ArrayFunction: parses each batch of lines
+    into columns, calls func, and formats the result into lines.
+    Picklable if func is, for use with processes. """
+    def __init__(self, func, dtype=float, delimiter='\t', fmt=None):
+        self.func = func
+        self.dtype = dtype
+        self.delimiter = delimiter
+        self.fmt = fmt
+        self.__name__ = getattr(func, '__name__', repr(func))
+        # identity for the result cache
+        self.__module__ = getattr(func, '__module__', None)
+        self.__qualname__ = '{}[dtype={!r}, delimiter={!r}, fmt={!r}]'.format(
+            getattr(func, '__qualname__', self.__name__),
+            dtype, delimiter, fmt)
+        code = getattr(func, '__code__', None)
+        if code is not None:
+            self.__code__ = code
+
+    def __reduce__(self):
+        # code objects can not be pickled, so rebuild from the arguments
+        return (self.__class__,
+                (self.func, self.dtype, self.delimiter, self.fmt))
+
+    def __call__(self, blocks):
+        for lines in blocks:
+            if len(lines) == 0:
+                continue
+            columns = self.parse(lines)
+            yield self.format(self.func(*columns))
+
+    def parse(self, lines):
+        """ One array per column from a list of lines """
+        n_columns = len(lines[0].rstrip('\n').split(self.delimiter))
+        text = ''.join(lines)
+        if self._parse_in_c(text):
+            # parsed in C, without splitting into Python strings
+            values = numpy.fromstring(text, dtype=self.dtype, sep=' ')
+            if values.size != len(lines) * n_columns:
+                raise ValueError(
+                    'Expected {} columns on each of {} lines, '
+                    'found {} values'.format(
+                        n_columns, len(lines), values.size))
+            table = values.reshape(len(lines), n_columns)
+            return [table[:, i] for i in range(n_columns)]
+        table = numpy.array(
+            [line.rstrip('\n').split(self.delimiter) for line in lines])
+        if table.ndim != 2:
+            raise ValueError('Lines have differing numbers of columns')
+        dtypes = self.dtype if isinstance(self.dtype, (list, tuple)) \
+            else [self.dtype] * n_columns
+        return [table[:, i].astype(dtype) for i, dtype in enumerate(dtypes)]
+
+    def _parse_in_c(self, text):
+        """ Whether numpy.fromstring can parse text: numeric values,
+        separated by whitespace that is all delimiters or newlines """
+        if isinstance(self.dtype, (list, tuple)) \
+                or self.delimiter not in _WHITESPACE \
+                or numpy.dtype(self.dtype).kind not in 'biuf':
+            return False
+        # fromstring splits on any whitespace, e.g. within tab
+        # delimited fields containing spaces
+        return self.delimiter is None or all(
+            space not in text for space in _WHITESPACE[1:]
+            if space != self.delimiter)
+
+    def format(self, result):
+        """ A list of lines from the columns returned by func """
+        if isinstance(result, (list, tuple)):
+            columns = [numpy.asarray(column) for column in result]
+        else:
+            result = numpy.asarray(result)
+            columns = [result] if result.ndim == 1 else list(result.T)
+        if len(columns) == 0 or len(columns[0]) == 0:
+            return []
+        fmts = self.fmt if isinstance(self.fmt, (list, tuple)) \
+            else [self.fmt] * len(columns)
+        texts = [(column.astype(str) if fmt is None
+                  else numpy.char.mod(fmt, column)).tolist()
+                 for column, fmt in zip(columns, fmts)]
+        if len(texts) == 1:
+            text = '\n'.join(texts[0])
+        else:
+            text = '\n'.join(map((self.delimiter or '\t').join,
+                                 zip(*texts)))
+        return (text + '\n').splitlines(True)
+
+    def __repr__(self):
+        return 'ArrayBlocks({})'.format(self.__name__)
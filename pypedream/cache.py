@@ -0,0 +1,322 @@
+"""
+Caching the output files of pipelines
+"""
+
+import json
+import os
+import pathlib
+import shlex
+import shutil
+import types
+
+from .pypedream import _LazyModule
+
+hashlib = _LazyModule('hashlib')
+tempfile = _LazyModule('tempfile')
+
+try:
+    import fcntl
+except ImportError:
+    # not available on Windows
+    fcntl = None
+
+# ioctl cloning a file on copy-on-write file systems (Linux)
+FICLONE = 0x40049409
+
+
+def _is_path(endpoint):
+    return isinstance(endpoint, (str, pathlib.PurePath))
+
+
+def _code_digest(code, digest):
+    """ Hashes bytecode, names and constants,
+    recursing into nested functions """
+    digest.update(code.co_code)
+    digest.update(repr(code.co_names).encode('utf-8'))
+    for const in code.co_consts:
+        if hasattr(const, 'co_code'):
+            _code_digest(const, digest)
+        else:
+            digest.update(repr(const).encode('utf-8'))
+
+
+def _global_names(code, names):
+    """ The names code and its nested functions may load as globals """
+    names.update(code.co_names)
+    for const in code.co_consts:
+        if hasattr(const, 'co_code'):
+            _global_names(const, names)
+    return names
+
+
+# values captured by functions that are hashed by their repr
+_PLAIN_TYPES = (type(None), bool, int, float, complex, str, bytes)
+
+
+class _Unidentifiable(Exception):
+    """ A captured value without a stable representation """
+
+
+def _value_digest(value, digest, seen):
+    """ Hashes a function, and the values it captures: closure cells,
+    default arguments, referenced globals, and the bound object of methods.
+    Raises _Unidentifiable for values that can not be hashed stably,
+    e.g. objects whose repr contains their address. """
+    if isinstance(value, _PLAIN_TYPES):
+        digest.update(repr((type(value).__name__, value)).encode('utf-8'))
+        return
+    if id(value) in seen:
+        # e.g. a recursive closure
+        digest.update(b'<cycle>')
+        return
+    seen.add(id(value))
+    digest.update(type(value).__qualname__.encode('utf-8'))
+    if isinstance(value, (tuple, list)):
+        digest.update(str(len(value)).encode('utf-8'))
+        for item in value:
+            _value_digest(item, digest, seen)
+    elif isinstance(value, (set, frozenset)):
+        digest.update(str(len(value)).encode('utf-8'))
+        for item in sorted(value, key=repr):
+            _value_digest(item, digest, seen)
+    elif isinstance(value, dict):
+        digest.update(str(len(value)).encode('utf-8'))
+        for key, item in sorted(value.items(), key=lambda kv: repr(kv[0])):
+            _value_digest(key, digest, seen)
+            _value_digest(item, digest, seen)
+    elif isinstance(value, types.CodeType):
+        _code_digest(value, digest)
+    elif isinstance(value, types.FunctionType):
+        _code_digest(value.__code__, digest)
+        _value_digest(value.__defaults__, digest, seen)
+        _value_digest(value.__kwdefaults__, digest, seen)
+        for cell in value.__closure__ or ():
+            try:
+                contents = cell.cell_contents
+            except ValueError:
+                # not assigned yet
+                contents = '<empty cell>'
+            _value_digest(contents, digest, seen)
+        # co_names also holds attribute names, which are skipped
+        # unless a global of the same name exists
+        namespace = value.__globals__
+        for name in sorted(_global_names(value.__code__, set())):
+            if name in namespace:
+                digest.update(name.encode('utf-8'))
+                _value_digest(namespace[name], digest, seen)
+    elif isinstance(value, types.MethodType):
+        _value_digest(value.__func__, digest, seen)
+        _value_digest(value.__self__, digest, seen)
+    elif isinstance(value, (type, types.BuiltinFunctionType)):
+        digest.update(repr((getattr(value, '__module__', None),
+                            value.__qualname__)).encode('utf-8'))
+        bound = getattr(value, '__self__', None)
+        if bound is not None and not isinstance(
+                bound, (type, types.ModuleType)):
+            # e.g. the str of 'a'.upper
+            _value_digest(bound, digest, seen)
+    elif isinstance(value, types.ModuleType):
+        digest.update(value.__name__.encode('utf-8'))
+    elif type(value).__module__ != 'builtins' \
+            and hasattr(value, '__dict__') \
+            and not hasattr(type(value), '__slots__'):
+        # instances of plain Python classes, by their attributes
+        _value_digest(type(value), digest, seen)
+        _value_digest(vars(value), digest, seen)
+    else:
+        raise _Unidentifiable(value)
+
+
+def function_identity(transform):
+    """ What identifies the behaviour of the callable of a Function:
+    its name, version, bytecode, and captured and global values.
+    None if it can not be identified. """
+    func = getattr(transform, 'func', None)
+    if func is None:
+        # e.g. Tee, which has side effects
+        return None
+    version = getattr(transform, 'version', None)
+    name = getattr(func, '__qualname__', None)
+    if name is None and version is None:
+        return None
+    identity = {
+        'module': getattr(func, '__module__', None),
+        'name': name,
+        'version': version,
+        'batch': transform.batch,
+    }
+    digest = hashlib.sha256()
+    try:
+        _value_digest(func, digest, set())
+    except _Unidentifiable:
+        if version is None:
+            return None
+        # the version stands for what can not be hashed
+        code = getattr(func, '__code__', None)
+        if code is None:
+            return identity
+        digest = hashlib.sha256()
+        _code_digest(code, digest)
+    identity['code'] = digest.hexdigest()
+    return identity
+
+
+def _clone_or_copy(source, dest):
+    """ Copies source to dest, sharing the blocks if the file system
+    supports it """
+    if fcntl is not None:
+        with open(source, 'rb') as src, open(dest, 'wb') as dst:
+            try:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+                return
+            except OSError:
+                pass
+    shutil.copyfile(source, dest)
+
+
+class ResultCache():
+    """ Stores the output files of pipelines, so that rerunning
+    an unchanged pipeline copies the stored output instead.
+    Enabled with the cache pipeline option:
+
+        cache = pyd.ResultCache('.pypedream-cache', max_size=10 * 2**30)
+        (file_r >> cmd | cmd >> file_w).configure(cache=cache)
+
+    Only pipelines writing into a file, and reading from a file or None,
+    are cached. The key consists of the command lines, the identity of
+    the Functions (name, version, bytecode, and captured and global
+    values), the options and the input file. The input is identified
+    by its path, size and modification time, or by a hash of its content
+    if content_hash is set. Files named in command line arguments are
+    not tracked: use the version argument of Function, or a new cache,
+    when something else changes.
+
+    Stored outputs are cloned or copied into place. With link=True
+    they are hardlinked instead, which is faster but shares the file:
+    the output must then not be modified in place.
+    The least recently used outputs are removed to keep the total
+    size below max_size bytes. """
+    def __init__(self, directory, max_size=None,
+                 content_hash=False, link=False):
+        self.directory = pathlib.Path(directory)
+        self.max_size = max_size
+        self.content_hash = content_hash
+        self.link = link
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def key(self, pype, input, output):
+        """ The cache key for running pype with the given endpoints,
+        or None if the run can not be cached """
+        if not _is_path(output):
+            return None
+        if input is not None and not _is_path(input):
+            return None
+        commands = []
+        for command in pype.commands:
+            if isinstance(command, str):
+                commands.append(shlex.split(command))
+                continue
+            identity = function_identity(command)
+            if identity is None:
+                return None
+            commands.append(identity)
+        options = {key: value for key, value in pype.options.items()
+                   if key != 'cache'}
+        parts = {
+            'commands': commands,
+            'options': options,
+            'input': None if input is None else self._fingerprint(input),
+            # e.g. the compression of the output
+            'suffix': pathlib.Path(output).suffix,
+        }
+        encoded = json.dumps(parts, sort_keys=True, default=repr)
+        return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+    def _fingerprint(self, path):
+        path = pathlib.Path(path)
+        if self.content_hash:
+            digest = hashlib.sha256()
+            with path.open('rb') as fobj:
+                for block in iter(lambda: fobj.read(1 << 20), b''):
+                    digest.update(block)
+            return digest.hexdigest()
+        st = path.stat()
+        return [str(path.resolve()), st.st_size, st.st_mtime_ns]
+
+    def _entry(self, key):
+        return self.directory / key
+
+    def restore(self, key, output):
+        """ Materializes the stored output for key,
+        returning False if there is none.
+        Like a pipeline, appends to an existing nonempty output. """
+        entry = self._entry(key)
+        try:
+            # mark as recently used
+            os.utime(entry)
+        except FileNotFoundError:
+            return False
+        output = pathlib.Path(output)
+        if output.exists() and output.stat().st_size > 0:
+            with entry.open('rb') as src, output.open('ab') as dst:
+                shutil.copyfileobj(src, dst, 1 << 20)
+            return True
+        if output.exists():
+            output.unlink()
+        if self.link:
+            try:
+                os.link(entry, output)
+                return True
+            except OSError:
+                # e.g. on another file system
+                pass
+        _clone_or_copy(entry, output)
+        return True
+
+    def store(self, key, output, offset=0):
+        """ Stores the output written by a pipeline run,
+        starting at offset if the run appended to an existing file """
+        entry = self._entry(key)
+        fd, tmp = tempfile.mkstemp(suffix='.tmp', dir=self.directory)
+        os.close(fd)
+        if offset == 0:
+            _clone_or_copy(output, tmp)
+        else:
+            with open(output, 'rb') as src, open(tmp, 'wb') as dst:
+                src.seek(offset)
+                shutil.copyfileobj(src, dst, 1 << 20)
+        os.replace(tmp, entry)
+        self.evict()
+
+    def evict(self):
+        """ Removes the least recently used outputs
+        until the cache fits in max_size """
+        if self.max_size is None:
+            return
+        entries = []
+        for path in self.directory.iterdir():
+            if path.suffix == '.tmp':
+                continue
+            try:
+                st = path.stat()
+            except FileNotFoundError:
+                # evicted concurrently
+                continue
+            entries.append((st.st_mtime_ns, st.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self):
+        """ Removes all stored outputs """
+        for path in self.directory.iterdir():
+            path.unlink()
+
+    def __repr__(self):
+        return '{}({})'.format(self.__class__.__name__, self.directory)
@@ -0,0 +1,80 @@
+"""
+Transparent (de)compression of file endpoints
+"""
+
+import importlib
+import pathlib
+import shlex
+
+from .pypedream import which
+
+
+class Codec():
+    """ A compression format, recognized by file suffix.
+
+    Files can be (de)compressed either in-process using a Python module,
+    or by an external helper executable, which runs on its own core(s)
+    and streams directly to or from the neighbouring stage.
+    The command lines are candidates in order of preference:
+    the first one found in PATH is used. """
+    def __init__(self, suffix, module, decompress=(), compress=()):
+        self.suffix = suffix
+        self.module = module
+        self.decompress = list(decompress)
+        self.compress = list(compress)
+
+    def open(self, path, mode):
+        """ Opens path using the Python module """
+        try:
+            module = importlib.import_module(self.module)
+        except ImportError:
+            raise ImportError(
+                'Reading or writing {} files requires either the Python '
+                'module "{}" or one of the executables {}'.format(
+                    self.suffix, self.module,
+                    self.decompress + self.compress))
+        return module.open(path, mode)
+
+    def command(self, mode):
+        """ The first available external command line for mode,
+        or None if none of them is installed """
+        candidates = self.decompress if 'r' in mode else self.compress
+        for commandline in candidates:
+            if which(shlex.split(commandline)[0]) is not None:
+                return commandline
+        return None
+
+    def __repr__(self):
+        return '{}({})'.format(self.__class__.__name__, self.suffix)
+
+
+CODECS = {}
+
+
+def register_codec(codec):
+    """ Adds or replaces the codec for a file suffix """
+    CODECS[codec.suffix] = codec
+    return codec
+
+
+def find_codec(path):
+    """ The codec for the suffix of path, or None for plain files """
+    return CODECS.get(pathlib.Path(path).suffix)
+
+
+register_codec(Codec(
+    '.gz', 'gzip',
+    decompress=['pigz -dc', 'gzip -dc'],
+    compress=['pigz -c', 'gzip -c']))
+register_codec(Codec(
+    '.bz2', 'bz2',
+    decompress=['lbzip2 -dc', 'pbzip2 -dc', 'bzip2 -dc'],
+    compress=['lbzip2 -c', 'pbzip2 -c', 'bzip2 -c']))
+register_codec(Codec(
+    '.xz', 'lzma',
+    decompress=['xz -dc -T0'],
+    compress=['xz -c -T0']))
+register_codec(Codec(
+    '.zst', 'zstandard',
+    decompress=['zstd -dcq'],
+    compress=['zstd -cq -T0']))
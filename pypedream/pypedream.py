@@ -2,13 +2,55 @@
 pypedream - Utility library for scriptwriting
 """
 
+import collections
 import contextlib
-import gzip
+import functools
+import importlib
+import io
+import itertools
+import operator
+import os
 import pathlib
 import shlex
-import subprocess
+import stat
 import sys
 import threading
+import time
+
+from .stats import (
+    PipelineStats, StageStats, thread_rusage, wait_with_rusage)
+
+
+class _LazyModule():
+    """ Imports a module on first use.
+    Keeps importing pypedream fast for short scripts. """
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+
+asyncio = _LazyModule('asyncio')
+codecs = _LazyModule('codecs')
+futures = _LazyModule('concurrent.futures')
+heapq = _LazyModule('heapq')
+inspect = _LazyModule('inspect')
+locale = _LazyModule('locale')
+multiprocessing = _LazyModule('multiprocessing')
+queue = _LazyModule('queue')
+shutil = _LazyModule('shutil')
+signal = _LazyModule('signal')
+subprocess = _LazyModule('subprocess')
+tempfile = _LazyModule('tempfile')
+traceback = _LazyModule('traceback')
+# imports pypedream itself
+compression = _LazyModule(__package__ + '.compression')
+records = _LazyModule(__package__ + '.records')
+scheduling = _LazyModule(__package__ + '.scheduling')
 
 
 class Unfilled():
@@ -19,15 +61,487 @@ class Unfilled():
 UNFILLED = Unfilled()
 
 
+class Iter():
+    """ Output endpoint returning the lines of output as an iterator,
+    e.g. for line in None >> cmd >> ITER. See PypeComponent.lines """
+    def __repr__(self):
+        return 'ITER'
+ITER = Iter()
+
+# Size of the blocks moved by shovels that copy data without looking at it
+CHUNK_SIZE = 1 << 20
+# lines per chunk passed between threaded Function stages
+QUEUE_CHUNK_LINES = 1000
+# seconds between SIGTERM and SIGKILL when stopping a pipeline
+TERMINATE_GRACE = 5.0
+# seconds between checks of the running stages,
+# when using the fail_fast or timeout options
+POLL_INTERVAL = 0.05
+
+# Pipeline-wide options, with their default values
+DEFAULT_OPTIONS = {
+    # exchange raw bytes between stages and endpoints
+    'binary': False,
+    # 'thread': one thread per Function group,
+    # 'async': run on an asyncio event loop (see AsyncExecute)
+    'engine': 'thread',
+    # compressed file endpoints:
+    # 'external': (de)compress in a helper process, e.g. pigz or zstd
+    # 'python': (de)compress in-process, using e.g. the gzip module
+    # 'auto': external if an executable is found, otherwise python
+    'compression': 'auto',
+    # run each Function of a group in its own thread,
+    # passing chunks of lines through bounded queues (see _ThreadedStage)
+    'function_threads': False,
+    # a ResultCache, to skip rerunning unchanged pipelines
+    'cache': None,
+    # look up all executables in PATH before starting any stage
+    'check_executables': True,
+    # how subprocesses are started:
+    # 'popen': using subprocess.Popen
+    # 'spawn': using os.posix_spawn where possible (see SpawnedProcess)
+    'launcher': 'popen',
+    # if a number of bytes, keep the end of the standard error
+    # of each subprocess in memory instead of passing it through,
+    # and attach it to the RetcodeException if the subprocess fails
+    'capture_stderr': None,
+    # stop the other stages as soon as one fails, see Execute.stop
+    'fail_fast': False,
+    # seconds after which the pipeline is stopped,
+    # raising a TimeoutException
+    'timeout': None,
+    # a RecordCodec or its name, e.g. 'tsv', 'csv' or 'jsonl':
+    # Functions then exchange records instead of lines, which are
+    # decoded and encoded only at Commands and file endpoints
+    'records': None,
+    # scheduling of subprocesses, see STAGE_OPTIONS
+    'affinity': None,
+    'nice': None,
+    'ionice': None,
+    'rlimits': None,
+}
+
+# Options that can also be given to a single Command, e.g.
+# Command('sort -S 4G', nice=10, rlimits={'as': 8 << 30}),
+# overriding the pipeline option for that stage:
+# 'affinity': the CPUs the subprocess may run on, e.g. {0, 1}
+# 'nice': increment of the nice value, e.g. 10 for background work
+# 'ionice': a best-effort I/O priority 0-7, 'idle',
+#   or a (class, level) tuple
+# 'rlimits': resource limits by name, e.g. {'as': 8 << 30, 'nofile': 4096},
+#   each a soft limit or a (soft, hard) tuple
+# They are applied by the taskset, nice, prlimit and ionice executables,
+# prefixed to the command line.
+# They apply to the subprocesses of Commands and compression helpers,
+# not to Functions, which run in this process.
+STAGE_OPTIONS = ('affinity', 'nice', 'ionice', 'rlimits')
+
+
+class MissingExecutableException(FileNotFoundError):
+    """ Executable(s) of a pipeline not found, before starting it """
+    def __init__(self, missing):
+        self.missing = missing
+        super().__init__(
+            'The following executables were not found: {}'.format(
+                ', '.join(missing)))
+
+
+class Failure(collections.namedtuple('Failure', ['args', 'retcode'])):
+    """ A failed stage, unpacking as (args, retcode).
+    stderr is the end of its standard error as bytes,
+    if captured using the capture_stderr option. """
+    stderr = None
+
+
+def _failure(args, retcode, ring=None):
+    failure = Failure(args, retcode)
+    if ring is not None:
+        failure.stderr = ring.getvalue()
+    return failure
+
+
 class RetcodeException(Exception):
     """ Executed command(s) with non-zero return code """
-    def __init__(self, failed):
+    def __init__(self, failed, stats=None):
+        self.failed = failed
+        self.stats = stats
         msg = 'The following processes failed: '
         for args, retcode in failed:
             msg += '{} with return code {}, '.format(args, retcode)
+        for failure in failed:
+            stderr = getattr(failure, 'stderr', None)
+            if stderr:
+                msg += '\n--- end of stderr of {} ---\n{}'.format(
+                    failure.args, stderr.decode(errors='replace'))
         super().__init__(msg)
 
 
+class TimeoutException(RetcodeException):
+    """ Pipeline(s) stopped for running longer than timeout seconds.
+    failed includes the stages terminated by the timeout. """
+    def __init__(self, failed, timeout, stats=None):
+        self.timeout = timeout
+        super().__init__(failed, stats=stats)
+
+    def __str__(self):
+        return 'Timed out after {} seconds. {}'.format(
+            self.timeout, super().__str__())
+
+
+class _Stopped(Exception):
+    """ Raised in Python stages of a stopped pipeline """
+
+
+class StderrRing():
+    """ Keeps the last size bytes written into a pipe.
+    A thread drains the pipe as soon as data arrives, so the writer
+    never blocks, and memory use stays bounded however much it writes. """
+    READ_SIZE = 1 << 16
+
+    def __init__(self, size):
+        self.size = size
+        self._chunks = collections.deque()
+        self._length = 0
+        read_fd, self.write_fd = os.pipe()
+        self._thread = threading.Thread(
+            target=self._drain, args=(read_fd,), daemon=True)
+        self._thread.start()
+
+    def _drain(self, read_fd):
+        with open(read_fd, 'rb', buffering=0) as pipe:
+            while True:
+                chunk = pipe.read(self.READ_SIZE)
+                if not chunk:
+                    return
+                self._chunks.append(chunk)
+                self._length += len(chunk)
+                # drop chunks that are entirely before the last size bytes
+                while self._length - len(self._chunks[0]) >= self.size:
+                    self._length -= len(self._chunks.popleft())
+
+    def close_writer(self):
+        """ Closes our copy of the write end, once the child has one """
+        os.close(self.write_fd)
+
+    def getvalue(self, timeout=1.0):
+        """ The captured bytes. Waits for the end of the stream,
+        unless e.g. a background grandchild keeps the pipe open. """
+        self._thread.join(timeout)
+        return b''.join(list(self._chunks))[-self.size:]
+
+
+@functools.lru_cache(maxsize=None)
+def _which(executable, path):
+    return shutil.which(executable, path=path)
+
+
+def which(executable):
+    """ The path of executable, or None if it is not found.
+    Lookups are cached for each value of PATH. """
+    return _which(executable, os.environ.get('PATH'))
+
+
+class SpawnedProcess():
+    """ A subprocess started using os.posix_spawnp, providing the parts
+    of the subprocess.Popen interface used by pypedream.
+
+    posix_spawn does not duplicate the memory mappings of the parent,
+    which makes starting many short commands from a large Python process
+    cheaper than fork. As with Popen, the child only inherits the standard
+    streams, and SIGPIPE is restored to its default action. """
+    def __init__(self, args, stdin=None, stdout=None, stderr=None,
+                 text=False):
+        self.args = args
+        self.returncode = None
+        self.stdin = None
+        self.stdout = None
+        self.stderr = None
+        file_actions = []
+        # child ends of pipes, and /dev/null
+        close_after = []
+        try:
+            for target, endpoint in ((0, stdin), (1, stdout), (2, stderr)):
+                if endpoint is None:
+                    continue
+                if endpoint == subprocess.PIPE:
+                    read_fd, write_fd = os.pipe()
+                    if target == 0:
+                        fd = read_fd
+                        self.stdin = open(write_fd, 'w' if text else 'wb')
+                    else:
+                        fd = write_fd
+                        self.stdout = open(read_fd, 'r' if text else 'rb')
+                    close_after.append(fd)
+                elif endpoint == subprocess.DEVNULL:
+                    fd = os.open(os.devnull, os.O_RDWR)
+                    close_after.append(fd)
+                elif isinstance(endpoint, int):
+                    fd = endpoint
+                else:
+                    fd = _fileno(endpoint)
+                file_actions.append((os.POSIX_SPAWN_DUP2, fd, target))
+            self.pid = os.posix_spawnp(
+                args[0], args, os.environ,
+                file_actions=file_actions,
+                setsigdef=(signal.SIGPIPE, signal.SIGXFSZ))
+        except BaseException:
+            for stream in (self.stdin, self.stdout):
+                if stream is not None:
+                    stream.close()
+            raise
+        finally:
+            for fd in close_after:
+                os.close(fd)
+
+    @staticmethod
+    def supports(stdin, stdout, stderr):
+        """ Whether the streams can be connected using posix_spawn.
+        Other cases need Popen, e.g. Python objects without a file
+        descriptor, or descriptors that would be overwritten by dup2
+        before being duplicated. """
+        if not hasattr(os, 'posix_spawnp'):
+            return False
+        for target, endpoint in ((0, stdin), (1, stdout), (2, stderr)):
+            if endpoint is None or endpoint in (
+                    subprocess.PIPE, subprocess.DEVNULL):
+                continue
+            fd = endpoint if isinstance(endpoint, int) else _fileno(endpoint)
+            if fd is None or (fd < 3 and fd != target):
+                return False
+        return True
+
+    def poll(self):
+        if self.returncode is None:
+            pid, status = os.waitpid(self.pid, os.WNOHANG)
+            if pid != 0:
+                self.returncode = os.waitstatus_to_exitcode(status)
+        return self.returncode
+
+    def wait(self):
+        if self.returncode is None:
+            _, status = os.waitpid(self.pid, 0)
+            self.returncode = os.waitstatus_to_exitcode(status)
+        return self.returncode
+
+    def send_signal(self, sig):
+        if self.returncode is None:
+            os.kill(self.pid, sig)
+
+    def terminate(self):
+        self.send_signal(signal.SIGTERM)
+
+    def kill(self):
+        self.send_signal(signal.SIGKILL)
+
+    def __repr__(self):
+        return '{}(args={!r}, returncode={!r})'.format(
+            self.__class__.__name__, self.args, self.returncode)
+
+
+def _is_subprocess(proc):
+    return isinstance(proc, (subprocess.Popen, SpawnedProcess))
+
+
+def _exit_status(proc):
+    """ Return code of a finished subprocess or thread, None if running.
+    Subprocesses are not reaped, so that waiting for them still
+    collects their resource usage. """
+    if not _is_subprocess(proc):
+        if proc.is_alive():
+            return None
+        return 0 if proc.exception is None else 1
+    if proc.returncode is not None:
+        return proc.returncode
+    if not hasattr(os, 'waitid'):
+        return proc.poll()
+    try:
+        result = os.waitid(
+            os.P_PID, proc.pid, os.WEXITED | os.WNOHANG | os.WNOWAIT)
+    except ChildProcessError:
+        return proc.poll()
+    if result is None:
+        return None
+    if result.si_code == os.CLD_EXITED:
+        return result.si_status
+    return -result.si_status
+
+
+def _until_stopped(iterable, stopping):
+    """ Passes items through, until the stopping Event is set """
+    for item in iterable:
+        if stopping.is_set():
+            raise _Stopped()
+        yield item
+
+
+def _fileno(endpoint):
+    """ Returns the file descriptor of an endpoint backed directly
+    by an OS file or pipe, or None if a Python object is in the way
+    (e.g. transparent decompression, iterables, callables). """
+    raw = getattr(endpoint, 'buffer', endpoint)
+    raw = getattr(raw, 'raw', raw)
+    if isinstance(raw, io.FileIO) and not raw.closed:
+        return raw.fileno()
+    return None
+
+
+def _regular_file_size(endpoint):
+    """ Size of an endpoint that is a regular file, otherwise None """
+    fd = _fileno(endpoint)
+    if fd is None:
+        return None
+    st = os.fstat(fd)
+    if not stat.S_ISREG(st.st_mode):
+        return None
+    return st.st_size
+
+
+def _counted(iterable, counter):
+    """ Passes items through, advancing counter once per item.
+    Avoids calling a Python function for each item. """
+    return map(operator.itemgetter(0), zip(iterable, counter))
+
+
+def _batches(lines, size):
+    """ Groups a stream of lines into lists of at most size lines """
+    lines = iter(lines)
+    return iter(lambda: list(itertools.islice(lines, size)), [])
+
+
+def _worker_pool(processes):
+    """ A pool of processes workers for a Function.
+    Forked, so that functions defined in an unguarded main script work,
+    and the script is not imported again. Execute starts the pools from
+    the calling thread before any pipeline threads, as forking from
+    a process running threads can deadlock the child on a lock held
+    by another thread. """
+    if 'fork' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('fork')
+    else:
+        context = multiprocessing.get_context('spawn')
+    return context.Pool(processes)
+
+
+def _process_transforms(commands):
+    """ The Transforms using worker processes in commands,
+    including those in the branches of Tees """
+    for command in commands:
+        if isinstance(command, TeeTransform):
+            for branch in command.branches:
+                yield from _process_transforms(branch.commands)
+        elif getattr(command, 'processes', None) is not None:
+            yield command
+
+
+def _apply_to_chunk(func, batched, chunk):
+    """ Runs func on a chunk of lines in a worker process """
+    if batched:
+        return list(itertools.chain.from_iterable(func(iter([chunk]))))
+    return list(func(iter(chunk)))
+
+
+class _ThreadedStage():
+    """ Pulls a stream in a thread of its own, passing it on
+    in chunks through a bounded queue. The consuming stage then
+    runs concurrently with the stages producing the stream. """
+    QUEUE_SIZE = 16
+
+    def __init__(self, stream, chunk_size):
+        self.queue = queue.Queue(self.QUEUE_SIZE)
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(
+            target=self._produce, args=(stream, chunk_size), daemon=True)
+        self.thread.start()
+
+    def _produce(self, stream, chunk_size):
+        try:
+            for chunk in _batches(stream, chunk_size):
+                if not self._put(chunk):
+                    return
+        except Exception as e:
+            self._put(e)
+            return
+        self._put(None)
+
+    def _put(self, item):
+        # give up if the consumer has stopped
+        while not self.stopped.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def __iter__(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield from item
+
+    def stop(self):
+        self.stopped.set()
+
+
+def _line_chunks(source):
+    """ Lists of complete lines from source, as soon as they are
+    available, rather than waiting for a fixed number of lines """
+    buffered = getattr(source, 'buffer', source)
+    read1 = getattr(buffered, 'read1', None)
+    if read1 is None:
+        # iterables
+        yield from _batches(source, 1000)
+        return
+    encoding = getattr(source, 'encoding', None) \
+        if buffered is not source else None
+    rest = b''
+    while True:
+        chunk = read1(CHUNK_SIZE)
+        if not chunk:
+            break
+        end = chunk.rfind(b'\n') + 1
+        if end == 0:
+            rest += chunk
+            continue
+        lines = io.BytesIO(rest + chunk[:end]).readlines()
+        rest = chunk[end:]
+        if encoding is not None:
+            lines = [line.decode(encoding) for line in lines]
+        yield lines
+    if len(rest) > 0:
+        yield [rest if encoding is None else rest.decode(encoding)]
+
+
+class _Fanout():
+    """ A write-only file-like object, copying into several sinks.
+    If writing into a sink raises BrokenPipeError, on_broken_pipe(sink)
+    is called, and the sink is dropped if it returns True. """
+    def __init__(self, sinks, on_broken_pipe=None):
+        self.sinks = list(sinks)
+        self.on_broken_pipe = on_broken_pipe
+
+    def write(self, data):
+        dropped = []
+        for sink in self.sinks:
+            try:
+                sink.write(data)
+            except BrokenPipeError:
+                if self.on_broken_pipe is None \
+                        or not self.on_broken_pipe(sink):
+                    raise
+                dropped.append(sink)
+        if len(dropped) > 0:
+            self.sinks = [sink for sink in self.sinks
+                          if all(sink is not d for d in dropped)]
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+
 def unique(a, b, name):
     values = set((a, b))
     # ignore None and UNFILLED
@@ -53,17 +567,33 @@ class PypeComponent():
                  commands=None,
                  output=UNFILLED,
                  stderr=sys.stderr,
-                 parallel=None):
+                 parallel=None,
+                 options=None):
         self.input = input
         self.commands = [] if commands is None else commands
         self.output = output
         self.parallel = parallel
+        self.options = {} if options is None else dict(options)
+        for key in self.options:
+            if key not in DEFAULT_OPTIONS:
+                raise Exception('Unknown pipeline option "{}"'.format(key))
         self._stderr = None
         self.stderr(stderr)
+        # the Execute of this pipeline, once started
+        self.execution = None
 
-        if all(x is not UNFILLED for x in (self.input, self.output)):
+        if all(x is not UNFILLED for x in (self.input, self.output)) \
+                and self.output is not ITER:
             # execute when both ends of pipeline are defined
-            Execute(self)
+            if self.options.get('engine') == 'async':
+                if self.parallel is not None:
+                    raise Exception(
+                        'The async engine can not be combined with '
+                        'Parallel. Use asyncio.gather on run_async instead')
+                self.execution = AsyncExecute(self)
+                asyncio.run(self.execution.run())
+            else:
+                self.execution = Execute(self)
 
     def new(self, **overrides):
         """ Creates a copy of self, with specified keyword attributes
@@ -74,8 +604,18 @@ class PypeComponent():
             'output': overrides.get('output', self.output),
             'stderr': overrides.get('stderr', self._stderr),
             'parallel': overrides.get('parallel', self.parallel),
+            'options': overrides.get('options', self.options),
         }
-        return PypeComponent(**kwargs)
+        return self._create(**kwargs)
+
+    @staticmethod
+    def _create(**kwargs):
+        """ A new PypeComponent, or the iterator over its output
+        if the output is ITER and the input is filled """
+        pype = PypeComponent(**kwargs)
+        if pype.output is ITER and pype.input is not UNFILLED:
+            return pype.lines()
+        return pype
 
     def __rshift__(self, other):
         """ self >> other. Pipes output of self into endpoint other. """
@@ -109,8 +649,26 @@ class PypeComponent():
             'output': other.output,
             'stderr': unique(self._stderr, other._stderr, 'stderr'),
             'parallel': unique(self.parallel, other.parallel, 'parallel'),
+            'options': self._merge_options(other),
         }
-        return PypeComponent(**kwargs)
+        return self._create(**kwargs)
+
+    def _merge_options(self, other):
+        options = {}
+        for key in set(self.options) | set(other.options):
+            # compared with == rather than as in unique,
+            # as values may be unhashable, e.g. the rlimits dict
+            value = self.options.get(key)
+            other_value = other.options.get(key)
+            if value is None:
+                value = other_value
+            elif other_value is not None and other_value != value:
+                raise Exception(
+                    'Cannot give two separate values for "{}" '
+                    '({} and {})'.format(key, value, other_value))
+            if value is not None:
+                options[key] = value
+        return options
 
     def __and__(self, other):
         """self & other. Causes pypeline to be run in parallel. """
@@ -126,11 +684,116 @@ class PypeComponent():
         self._stderr = stderr
         return self
 
+    @property
+    def stats(self):
+        """ PipelineStats of the execution, once it has finished """
+        if self.execution is None:
+            return None
+        return self.execution.stats
+
+    def run_async(self, input=UNFILLED, output=UNFILLED):
+        """ Returns an awaitable executing the pipeline
+        on the running event loop. Endpoints left unfilled
+        are not connected, as in run().
+        The awaitable returns the PipelineStats of the run. """
+        return AsyncExecute(self, input=input, output=output).run()
+
+    def lines(self, input=UNFILLED):
+        """ Starts the pipeline, returning a LineIterator over its output.
+        The lines are read from the pipe of the last stage in the calling
+        thread, without a sink thread in between. An unfilled input is
+        not connected, as in run(). """
+        input = self.input if input is UNFILLED else input
+        if input is UNFILLED:
+            input = None
+        if self.parallel is not None \
+                or self.options.get('engine') == 'async':
+            raise Exception(
+                'ITER output can not be combined with Parallel '
+                'or the async engine')
+        if isinstance(input, Sharded):
+            raise Exception('ITER output does not support Sharded input')
+        binary = self.options.get('binary', DEFAULT_OPTIONS['binary'])
+        read_fd, write_fd = os.pipe()
+        pipe = open(read_fd, 'rb' if binary else 'r')
+        output = open(write_fd, 'wb' if binary else 'w')
+        try:
+            execution = Execute.start(
+                self, input, output, owned_output=True)
+        except BaseException:
+            output.close()
+            pipe.close()
+            raise
+        return LineIterator(execution, pipe)
+
+    def executables(self, input=UNFILLED):
+        """ The executables of the Commands of the pipeline,
+        including those of Tee branches and Merge sources """
+        input = self.input if input is UNFILLED else input
+        for command in self.commands:
+            if isinstance(command, str):
+                args = shlex.split(command)
+                if len(args) > 0:
+                    yield args[0]
+            elif isinstance(command, TeeTransform):
+                for branch in command.branches:
+                    yield from branch.executables()
+        if isinstance(input, Merge):
+            for source in input.sources:
+                if isinstance(source, PypeComponent):
+                    yield from source.executables()
+
+    def check_executables(self, input=UNFILLED):
+        """ Raises MissingExecutableException if any of the executables
+        is not found. Done automatically before starting the pipeline,
+        unless the check_executables option is False. """
+        missing = sorted(set(
+            executable for executable in self.executables(input)
+            if which(executable) is None))
+        if len(missing) > 0:
+            raise MissingExecutableException(missing)
+
+    def compile(self):
+        """ Prepares the pipeline for running many times,
+        see CompiledPipeline """
+        return CompiledPipeline(self)
+
+    def configure(self, **options):
+        """ Creates a copy of self with pipeline options set.
+        See DEFAULT_OPTIONS for the available options. """
+        merged = dict(self.options)
+        merged.update(options)
+        return self.new(options=merged)
+
+
+class StageCommand(str):
+    """ The command line of a Command with options of its own,
+    see STAGE_OPTIONS """
+    def __new__(cls, command, stage_options):
+        self = super().__new__(cls, command)
+        self.stage_options = stage_options
+        return self
+
+    def __reduce__(self):
+        return (self.__class__, (str(self), self.stage_options))
+
+
+def _with_stage_options(command, stage_options):
+    if not stage_options:
+        return command
+    return StageCommand(command, stage_options)
+
 
 class Command(PypeComponent):
-    """ An external executable PypeComponent """
-    def __init__(self, command):
-        super().__init__(commands=[command])
+    """ An external executable PypeComponent.
+    Keyword arguments are pipeline options, e.g. binary=True,
+    except STAGE_OPTIONS, which only apply to this Command. """
+    def __init__(self, command, **options):
+        stage_options = {key: options.pop(key)
+                         for key in STAGE_OPTIONS if key in options}
+        super().__init__(
+            commands=[_with_stage_options(command, stage_options)],
+            options=options)
 
     def __add__(self, other):
         """ Add command line arguments """
@@ -139,7 +802,12 @@ class Command(PypeComponent):
                 'The + operator must be used directly '
                 'on individual Commands')
         command = self.commands[0] + ' ' + other
-        return self.new(commands=[command])
+        return self._with_command(command)
+
+    def _with_command(self, command):
+        """ A copy with a new command line, keeping the stage options """
+        return self.new(commands=[_with_stage_options(
+            command, getattr(self.commands[0], 'stage_options', None))])
 
     def format(self, *args, **kwargs):
         """ Fill in concrete arguments in a commandline
@@ -149,13 +817,571 @@ class Command(PypeComponent):
                 'The format method must be used directly '
                 'on individual Commands')
         command = self.commands[0].format(*args, **kwargs)
-        return self.new(commands=[command])
+        return self._with_command(command)
 
 
 class Function(PypeComponent):
-    """ A native Python PypeComponent """
-    def __init__(self, func):
-        super().__init__(commands=[func])
+    """ A native Python PypeComponent.
+
+    If batch is given, func receives lists of up to batch lines
+    instead of single lines, and must yield lists of lines.
+
+    If processes is given, the input is split into chunks of chunk_size
+    lines (or batches), which are transformed by a pool of worker
+    processes. func must then be picklable, and must treat each chunk
+    independently. The output is in input order, unless ordered=False.
+    The workers are forked when the pipeline starts, before its
+    threads (see _worker_pool).
+
+    version identifies the behaviour of func for the result cache,
+    in addition to its bytecode. Change it when func depends on
+    something else that changed, e.g. a model file.
+    """
+    def __init__(self, func, batch=None,
+                 processes=None, chunk_size=1000, ordered=True,
+                 version=None):
+        super().__init__(commands=[Transform(
+            func, batch=batch, processes=processes,
+            chunk_size=chunk_size, ordered=ordered, version=version)])
+
+
+class Transform():
+    """ The callable stored in the commands of a Function,
+    carrying the per-stage options. """
+    def __init__(self, func, batch=None,
+                 processes=None, chunk_size=1000, ordered=True,
+                 version=None):
+        self.func = func
+        self.version = version
+        self.processes = processes
+        self.ordered = ordered
+        self.batched_func = batch is not None
+        # the batches seen by the rest of the group:
+        # chunks are passed to worker processes as batches
+        if processes is not None and batch is None:
+            batch = chunk_size
+        self.batch = batch
+        self.__name__ = getattr(func, '__name__', repr(func))
+
+    def __call__(self, *args, pools=None):
+        """ pools maps the id of Transforms to the worker pools
+        started by Execute. Without one, a pool is started here. """
+        if self.processes is None:
+            return self.func(*args)
+        if len(args) == 0:
+            raise Exception(
+                'Function {} has no input to divide between '
+                'processes'.format(self.__name__))
+        pool = None if pools is None else pools.get(id(self))
+        return self._map_processes(*args, pool=pool)
+
+    def _map_processes(self, chunks, pool=None):
+        """ Transforms chunks in worker processes,
+        keeping a bounded number of chunks in flight """
+        own_pool = pool is None
+        if own_pool:
+            pool = _worker_pool(self.processes)
+        max_pending = 2 * self.processes
+        # results of unordered chunks, as (error, result)
+        done = queue.Queue()
+        pending = collections.deque()
+        try:
+            for chunk in chunks:
+                args = (self.func, self.batched_func, chunk)
+                if self.ordered:
+                    pending.append(pool.apply_async(_apply_to_chunk, args))
+                else:
+                    pending.append(pool.apply_async(
+                        _apply_to_chunk, args,
+                        callback=lambda result: done.put((None, result)),
+                        error_callback=lambda error: done.put((error, None))))
+                if len(pending) < max_pending:
+                    continue
+                yield self._next_result(pending, done)
+            while len(pending) > 0:
+                yield self._next_result(pending, done)
+        finally:
+            if own_pool:
+                pool.terminate()
+
+    def _next_result(self, pending, done):
+        if self.ordered:
+            return pending.popleft().get()
+        pending.pop()
+        error, result = done.get()
+        if error is not None:
+            raise error
+        return result
+
+    def __repr__(self):
+        return self.__name__
+
+
+class CompiledPipeline():
+    """ A pipeline prepared once for running many times with different
+    endpoints, e.g.
+
+        plan = (myprog | pyd.Function(func) | myprog).compile()
+        for path in paths:
+            plan.run(path, path.with_suffix('.out'))
+
+    The command lines are split, the executables resolved to full paths
+    and the stages grouped only once, when compiling. A missing executable
+    raises MissingExecutableException already then. """
+    def __init__(self, pype):
+        self.pype = pype
+        self.grouped = tuple(Execute._group_commands(pype.commands))
+        self.argv = {}
+        missing = []
+        check = pype.options.get(
+            'check_executables', DEFAULT_OPTIONS['check_executables'])
+        for command in pype.commands:
+            if not isinstance(command, str) or command in self.argv:
+                continue
+            argv = shlex.split(command)
+            if len(argv) > 0 and check:
+                executable = which(argv[0])
+                if executable is None:
+                    missing.append(argv[0])
+                else:
+                    argv[0] = executable
+            self.argv[command] = tuple(argv)
+        if len(missing) > 0:
+            raise MissingExecutableException(sorted(set(missing)))
+
+    def _endpoints(self, input, output):
+        input = self.pype.input if input is UNFILLED else input
+        output = self.pype.output if output is UNFILLED else output
+        return (None if input is UNFILLED else input,
+                None if output is UNFILLED else output)
+
+    def run(self, input=UNFILLED, output=UNFILLED, parallel=None):
+        """ Runs the pipeline with the given endpoints.
+        Endpoints left unfilled are not connected, as in run().
+        Returns the Execute of the run, with its stats.
+        If a Parallel context is given, the run is added to it instead
+        of waiting for it. """
+        input, output = self._endpoints(input, output)
+        if self.pype.options.get('engine') == 'async':
+            if parallel is not None:
+                raise Exception(
+                    'The async engine can not be combined with Parallel')
+            execution = AsyncExecute(self.pype, input, output, plan=self)
+            asyncio.run(execution.run())
+            return execution
+        execution = Execute.create(self.pype, input, output, plan=self)
+        if parallel is not None:
+            # the context, or the pseudo command it returns
+            parallel = getattr(parallel, 'parallel', parallel)
+            return parallel.add_pipeline(execution)
+        execution.execute()
+        execution.wait()
+        return execution
+
+    def run_async(self, input=UNFILLED, output=UNFILLED):
+        """ Returns an awaitable running the pipeline
+        with the given endpoints, using the async engine """
+        input, output = self._endpoints(input, output)
+        return AsyncExecute(self.pype, input, output, plan=self).run()
+
+    def __repr__(self):
+        return '{}({})'.format(self.__class__.__name__, self.pype.commands)
+
+
+class Tee(PypeComponent):
+    """ Copies the stream into several branch pipelines,
+    while also passing it through unchanged.
+
+    The branches are pipelines with unfilled input,
+    e.g. Tee(cmd_a >> file_a, Function(func) >> None).
+    Writing blocks while a branch is not keeping up,
+    so only the pipe buffers are used for buffering.
+    A branch that exits successfully without reading all of its input,
+    e.g. head, stops receiving the stream, like tee -p.
+    If a branch fails, the other branches are terminated. """
+    def __init__(self, *branches):
+        for branch in branches:
+            if branch.input is not UNFILLED:
+                raise Exception(
+                    'The input of Tee branch {} is already '
+                    'filled'.format(branch))
+        super().__init__(commands=[TeeTransform(branches)])
+
+
+class TeeTransform():
+    """ The callable stored in the commands of a Tee.
+
+    Within a group of Functions it copies lines. A Tee that is not
+    adjacent to Functions is run by a shovel copying large chunks. """
+    def __init__(self, branches):
+        self.branches = branches
+        self.batch = None
+        self.__name__ = 'tee'
+
+    def open_branches(self, binary, pools=None):
+        """ Starts the branches, returning the running
+        executions and the pipes feeding them.
+        pools are the worker pools of the pipeline, see Transform. """
+        started = []
+        for branch in self.branches:
+            read_fd, write_fd = os.pipe()
+            branch_binary = branch.options.get(
+                'binary', DEFAULT_OPTIONS['binary'])
+            output = None if branch.output is UNFILLED else branch.output
+            try:
+                execution = Execute.start(
+                    branch,
+                    open(read_fd, 'rb' if branch_binary else 'r'),
+                    output,
+                    owned_input=True,
+                    pools=pools)
+            except Exception:
+                os.close(write_fd)
+                self.close_branches(started, failed=True)
+                raise
+            started.append(
+                (execution, open(write_fd, 'wb' if binary else 'w')))
+        return started
+
+    def close_branches(self, started, failed=False):
+        """ Waits for the branches to finish.
+        If failed is True, the branches are terminated first. """
+        errors = []
+        for execution, writer in started:
+            if failed:
+                execution.terminate()
+            try:
+                writer.close()
+            except OSError:
+                # the branch has already exited
+                pass
+        for execution, _ in started:
+            try:
+                execution.wait()
+            except RetcodeException as e:
+                errors.extend(e.failed)
+        if len(errors) > 0:
+            raise RetcodeException(errors)
+
+    def branch_closed(self, started, writer):
+        """ Handles writing into the branch of writer raising
+        BrokenPipeError. The branch is removed from started and waited
+        for, raising RetcodeException if it failed. Returns True,
+        i.e. writer is to be dropped, if it exited successfully. """
+        for i, (execution, branch_writer) in enumerate(started):
+            if branch_writer is writer:
+                del started[i]
+                break
+        else:
+            return False
+        try:
+            writer.close()
+        except OSError:
+            # unwritten buffered data
+            pass
+        execution.wait()
+        return True
+
+    def __call__(self, stream, pools=None):
+        started = self.open_branches(binary=False, pools=pools)
+        writers = [writer for _, writer in started]
+        failed = True
+        try:
+            for line in stream:
+                for writer in writers:
+                    try:
+                        writer.write(line)
+                    except BrokenPipeError:
+                        self.branch_closed(started, writer)
+                if len(writers) > len(started):
+                    writers = [writer for _, writer in started]
+                yield line
+            failed = False
+        finally:
+            self.close_branches(started, failed=failed)
+
+    def __repr__(self):
+        return 'Tee({})'.format(self.branches)
+
+
+class Merge():
+    """ An input endpoint reading from several sources at once.
+
+    The sources can be anything usable as an input endpoint,
+    or pipelines with an unfilled output, e.g. Merge(file_a, file_r >> cmd).
+    All sources are opened, and upstream pipelines started, immediately.
+    The mode is one of:
+        'concat': all lines of each source in turn, like cat.
+        'interleave': lines in the order they become available.
+        'sorted': k-way merge of sorted sources, like sort -m.
+            key is used as in sorted(). """
+    MODES = ('concat', 'interleave', 'sorted')
+
+    def __init__(self, *sources, mode='concat', key=None):
+        if mode not in self.MODES:
+            raise Exception('Unknown Merge mode "{}", expecting one of {}'.format(
+                mode, self.MODES))
+        for source in sources:
+            if isinstance(source, PypeComponent) \
+                    and source.output is not UNFILLED:
+                raise Exception(
+                    'The output of Merge source {} is already '
+                    'filled'.format(source))
+        self.sources = sources
+        self.mode = mode
+        self.key = key
+
+    def open(self, execution):
+        """ Called by Execute when the pipeline starts.
+        Returns an iterator over the merged lines. """
+        return self._merge(execution)
+
+    def _merge(self, execution):
+        sources = []
+        upstream = []
+        try:
+            for source in self.sources:
+                if isinstance(source, PypeComponent):
+                    read_fd, write_fd = os.pipe()
+                    input = None if source.input is UNFILLED else source.input
+                    upstream.append(Execute.start(
+                        source, input,
+                        open(write_fd, 'wb' if execution.binary else 'w'),
+                        owned_output=True))
+                    sources.append(
+                        open(read_fd, 'rb' if execution.binary else 'r'))
+                else:
+                    sources.append(execution._normalize_endpoint(source, 'r'))
+            if self.mode == 'concat':
+                yield from itertools.chain.from_iterable(sources)
+            elif self.mode == 'sorted':
+                yield from heapq.merge(*sources, key=self.key)
+            else:
+                yield from itertools.chain.from_iterable(
+                    self._interleave(sources))
+        finally:
+            for source in sources:
+                execution._close_endpoint(source)
+            failed = []
+            for pipe in upstream:
+                try:
+                    pipe.wait()
+                except RetcodeException as e:
+                    failed.extend(e.failed)
+            if len(failed) > 0:
+                raise RetcodeException(failed)
+
+    def _interleave(self, sources):
+        """ Chunks of lines from all sources, first come first served """
+        chunks = queue.Queue(maxsize=4 * len(sources))
+
+        def read(source):
+            try:
+                for chunk in _line_chunks(source):
+                    chunks.put(chunk)
+                chunks.put(None)
+            except Exception as e:
+                chunks.put(e)
+
+        for source in sources:
+            threading.Thread(target=read, args=(source,), daemon=True).start()
+        remaining = len(sources)
+        while remaining > 0:
+            chunk = chunks.get()
+            if chunk is None:
+                remaining -= 1
+            elif isinstance(chunk, Exception):
+                raise chunk
+            else:
+                yield chunk
+
+    def __repr__(self):
+        return '{}({}, mode={})'.format(
+            self.__class__.__name__, self.sources, self.mode)
+
+
+class Sharded():
+    """ An input endpoint running the pipeline on parts of a large file.
+
+    The file is split at line boundaries into jobs shards of about equal
+    size, by seeking rather than reading through it. A copy of the
+    pipeline runs on each shard concurrently, like GNU parallel
+    --pipepart, and the outputs are concatenated in shard order into the
+    output endpoint. The pipeline must treat lines independently.
+    The shard outputs are stored in temporary files in tmpdir,
+    by default next to a file output. Compressed files can not be
+    sharded, as they can not be split by seeking. """
+    def __init__(self, path, jobs=None, tmpdir=None):
+        self.path = pathlib.Path(path)
+        if compression.find_codec(self.path) is not None:
+            raise Exception(
+                'Compressed file {} can not be sharded'.format(self.path))
+        self.jobs = jobs or os.cpu_count() or 1
+        self.tmpdir = tmpdir
+
+    def ranges(self):
+        """ The (start, end) byte offsets of the shards """
+        size = self.path.stat().st_size
+        bounds = [0]
+        with self.path.open('rb') as fobj:
+            for i in range(1, self.jobs):
+                target = size * i // self.jobs
+                if target <= bounds[-1]:
+                    continue
+                # the shard starts after the line containing target - 1
+                fobj.seek(target - 1)
+                fobj.readline()
+                start = fobj.tell()
+                if bounds[-1] < start < size:
+                    bounds.append(start)
+        bounds.append(size)
+        return list(zip(bounds, bounds[1:]))
+
+    def open(self, start, end, binary):
+        """ A pipe from which the byte range can be read,
+        filled by a thread of its own """
+        read_fd, write_fd = os.pipe()
+        threading.Thread(
+            target=self._send, args=(write_fd, start, end),
+            daemon=True).start()
+        return open(read_fd, 'rb' if binary else 'r')
+
+    def _send(self, write_fd, start, end):
+        try:
+            with self.path.open('rb') as fobj:
+                _send_range(fobj.fileno(), write_fd, start, end)
+        except BrokenPipeError:
+            # the shard pipeline stopped reading
+            pass
+        finally:
+            os.close(write_fd)
+
+    def __repr__(self):
+        return '{}({}, jobs={})'.format(
+            self.__class__.__name__, self.path, self.jobs)
+
+
+class Literal():
+    """ An input endpoint feeding a str or bytes into the pipeline,
+    e.g. pyd.Literal('b\\na\\n') >> sort >> output.
+
+    The data is written into a pipe read directly by the first stage.
+    What fits into the pipe buffer is written before the pipeline starts,
+    the rest by a thread of its own, so that writing can not deadlock. """
+    def __init__(self, data, encoding=None):
+        self.data = data
+        self.encoding = encoding
+
+    def open(self, binary):
+        """ A pipe from which the data can be read """
+        data = self.data
+        if isinstance(data, str):
+            data = data.encode(
+                self.encoding or locale.getpreferredencoding(False))
+        view = memoryview(data)
+        read_fd, write_fd = os.pipe()
+        os.set_blocking(write_fd, False)
+        written = 0
+        try:
+            while written < len(view):
+                written += os.write(write_fd, view[written:])
+        except BlockingIOError:
+            # the pipe buffer is full
+            pass
+        if written == len(view):
+            os.close(write_fd)
+        else:
+            os.set_blocking(write_fd, True)
+            threading.Thread(
+                target=self._send, args=(write_fd, view[written:]),
+                daemon=True).start()
+        return open(read_fd, 'rb' if binary else 'r')
+
+    @staticmethod
+    def _send(write_fd, view):
+        try:
+            while len(view) > 0:
+                view = view[os.write(write_fd, view):]
+        except BrokenPipeError:
+            # the pipeline stopped reading
+            pass
+        finally:
+            os.close(write_fd)
+
+    def __repr__(self):
+        return '{}({!r})'.format(self.__class__.__name__, self.data[:20])
+
+
+class Capture():
+    """ An output endpoint collecting the output in memory,
+    e.g. None >> cmd >> capture, then capture.getvalue().
+
+    getbuffer() returns the collected bytes as a memoryview, without
+    copying them. Text is stored encoded. If more than max_size bytes
+    are written, the first max_size bytes are kept,
+    and the stage writing them fails. """
+    def __init__(self, max_size=None, encoding=None):
+        self.max_size = max_size
+        self.encoding = encoding or locale.getpreferredencoding(False)
+        self._buffer = bytearray()
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode(self.encoding)
+        if self.max_size is not None \
+                and len(self._buffer) + len(data) > self.max_size:
+            # keep what fits
+            self._buffer += data[:self.max_size - len(self._buffer)]
+            raise Exception(
+                'Captured output exceeds max_size of {} bytes'.format(
+                    self.max_size))
+        self._buffer += data
+        return len(data)
+
+    def writelines(self, lines):
+        # joined in chunks, rather than appending line by line
+        for chunk in _batches(lines, QUEUE_CHUNK_LINES):
+            self.write(chunk[0][:0].join(chunk))
+
+    def getbuffer(self):
+        """ The output as a memoryview. Release it before reusing
+        the Capture: a bytearray can not grow while viewed. """
+        return memoryview(self._buffer)
+
+    def getvalue(self):
+        """ The output as bytes """
+        return bytes(self._buffer)
+
+    def text(self):
+        """ The output decoded into a str """
+        return self._buffer.decode(self.encoding)
+
+    def clear(self):
+        del self._buffer[:]
+
+    def __len__(self):
+        return len(self._buffer)
+
+    def __repr__(self):
+        return '{}({} bytes)'.format(self.__class__.__name__, len(self))
+
+
+def _send_range(in_fd, out_fd, start, end):
+    """ Copies a byte range of a file into a pipe,
+    in the kernel if possible """
+    offset = start
+    while offset < end:
+        count = min(end - offset, CHUNK_SIZE)
+        try:
+            sent = os.sendfile(out_fd, in_fd, offset, count)
+        except (AttributeError, OSError) as e:
+            if isinstance(e, BrokenPipeError):
+                raise
+            # sendfile into a pipe is not supported everywhere
+            sent = os.write(out_fd, os.pread(in_fd, count, offset))
+        if sent == 0:
+            break
+        offset += sent
 
 
 class ParallelPseudoCommand(PypeComponent):
@@ -165,47 +1391,292 @@ class ParallelPseudoCommand(PypeComponent):
 
 
 class Execute():
-    def __init__(self, pype):
-        self.pype = pype
+    # open file endpoints in binary mode even in text pipelines
+    binary_endpoints = False
 
-        self.input = self._normalize_endpoint(pype.input, 'r')
-        # does output need separate handling?
-        # FIXME: append for debug
-        self.output = self._normalize_endpoint(pype.output, 'a')
-        self.err = self._normalize_endpoint(pype._stderr, 'a')
-        # python commands need to be grouped
-        self.grouped = list(self._group_commands(pype.commands))
+    def __init__(self, pype):
+        self._prepare(pype, pype.input, pype.output)
 
-        self.execute()
         if pype.parallel is None:
             # waiting directly
+            self.execute()
             self.wait()
         else:
-            # letting context manager do the waiting
+            # letting context manager decide when to execute and wait
             pype.parallel.add_pipeline(self)
 
+    def _prepare(self, pype, input, output, plan=None):
+        self.pype = pype
+        # the CompiledPipeline being run, if any
+        self.plan = plan
+        self.binary = bool(self.option('binary'))
+        # set if the pipeline failed while run by a context manager
+        self.exception = None
+        # PipelineStats, set when finished
+        self.stats = None
+        # set if the output was taken from the result cache
+        self.cached = False
+        self._cache_key = None
+        # see start
+        self.owned_input = False
+        self.owned_output = False
+        # see stop
+        self.stopped = False
+        self._killer = None
+        # whether Python stages check for stop requests on every line
+        self.stoppable = bool(self.option('fail_fast')) \
+            or self.option('timeout') is not None
+        self.processes = []
+        self.codecs = []
+        self.shards = []
+        # default CPU affinity of the subprocesses, see Parallel
+        self.cpus = None
+        # worker pools of Functions using processes, by id of their
+        # Transform, None until started (see _start_pools)
+        self.pools = None
+        self._own_pools = False
+
+        self.input = input
+        self.output = output
+        self.err = pype._stderr
+        # python commands need to be grouped
+        if plan is not None:
+            self.grouped = list(plan.grouped)
+        else:
+            self.grouped = list(self._group_commands(pype.commands))
+
+    def _open_endpoints(self):
+        """ Endpoints are opened only when execution starts,
+        as queued pipelines would otherwise hold open files """
+        self._started = time.perf_counter()
+        # helper processes for compressed endpoints
+        self.codecs = []
+        # stderr is always text: Functions print to it
+        self.err = self._normalize_endpoint(self.err, 'a', text=True)
+        self.input = self._normalize_endpoint(self.input, 'r')
+        # does output need separate handling?
+        # FIXME: append for debug
+        self.output = self._normalize_endpoint(self.output, 'a')
+        self._input_size = _regular_file_size(self.input)
+        self._output_size = _regular_file_size(self.output)
+
+    @classmethod
+    def create(cls, pype, input, output, plan=None):
+        """ Prepares executing pype using the given endpoints,
+        without starting it """
+        self = cls.__new__(cls)
+        self._prepare(pype, input, output, plan=plan)
+        return self
+
+    @classmethod
+    def start(cls, pype, input, output,
+              owned_input=False, owned_output=False, plan=None, pools=None):
+        """ Starts executing pype using the given endpoints,
+        without waiting for it to finish.
+        Owned endpoints are pipes that are closed as soon as
+        the stage using them is done, rather than in wait.
+        pools are worker pools started by an enclosing pipeline. """
+        self = cls.create(pype, input, output, plan=plan)
+        self.owned_input = owned_input
+        self.owned_output = owned_output
+        self.pools = pools
+        self.execute()
+        return self
+
+    def terminate(self):
+        """ Stops the subprocesses of the pipeline """
+        for proc in self.processes + self.codecs:
+            if _is_subprocess(proc) and _exit_status(proc) is None:
+                proc.terminate()
+
+    def stop(self):
+        """ Stops the pipeline, without waiting for it to finish.
+        Subprocesses get SIGTERM, then SIGKILL if still running after
+        TERMINATE_GRACE seconds. Python stages stop at their next chunk,
+        or at their next line if self.stoppable. Python code that is
+        not consuming or producing data can not be interrupted. """
+        self._signal_stop()
+        if self._killer is None:
+            self._killer = threading.Timer(TERMINATE_GRACE, self._kill)
+            self._killer.daemon = True
+            self._killer.start()
+
+    def _signal_stop(self):
+        self.stopped = True
+        for shard in self.shards:
+            shard.stop()
+        for proc in self.processes:
+            if isinstance(proc, PythonPipelineThread):
+                proc.stop()
+        self.terminate()
+
+    def _stop_inline(self):
+        """ Stops the pipeline like stop, but waits for the subprocesses
+        in the calling thread, killing those still running after
+        TERMINATE_GRACE. Starts no threads, which may block forever
+        while the interpreter is shutting down. """
+        self._signal_stop()
+        procs = [proc for proc in self.processes + self.codecs
+                 if _is_subprocess(proc)]
+        deadline = time.perf_counter() + TERMINATE_GRACE
+        self._close_pools()
+        while any(_exit_status(proc) is None for proc in procs):
+            if time.perf_counter() >= deadline:
+                self._kill()
+                return
+            time.sleep(POLL_INTERVAL)
+
+    def _start_pools(self):
+        """ Starts the worker pools, unless given by an enclosing
+        pipeline. Forks, so must be called before starting threads. """
+        if self.pools is not None:
+            return
+        self.pools = {}
+        for transform in _process_transforms(self.pype.commands):
+            if id(transform) not in self.pools:
+                self._own_pools = True
+                self.pools[id(transform)] = _worker_pool(transform.processes)
+
+    def _close_pools(self):
+        """ Stops the worker pools started by this pipeline """
+        if self._own_pools:
+            for pool in self.pools.values():
+                pool.terminate()
+            self._own_pools = False
+
+    def _kill(self):
+        for proc in self.processes + self.codecs:
+            if _is_subprocess(proc) and _exit_status(proc) is None:
+                proc.kill()
+
+    def _supervise(self, stages):
+        """ Watches the running stages, stopping the pipeline at the
+        first failure if fail_fast is set, or when the timeout is reached.
+        Returns whether the timeout was reached. """
+        fail_fast = self.option('fail_fast')
+        timeout = self.option('timeout')
+        deadline = None if timeout is None else self._started + timeout
+        while True:
+            statuses = [_exit_status(proc) for proc in stages]
+            if all(status is not None for status in statuses):
+                return False
+            if fail_fast and any(status not in (None, 0)
+                                 for status in statuses):
+                self.stop()
+                return False
+            if deadline is not None and time.perf_counter() >= deadline:
+                self.stop()
+                return True
+            time.sleep(POLL_INTERVAL)
+
+    def option(self, name):
+        """ Value of a pipeline option, falling back to the default """
+        return self.pype.options.get(name, DEFAULT_OPTIONS[name])
+
+    def _restore_cached(self):
+        """ Looks up the output in the result cache, if any.
+        Returns True if the stored output was used instead of running. """
+        cache = self.option('cache')
+        if cache is None:
+            return False
+        self._cache_key = cache.key(self.pype, self.input, self.output)
+        if self._cache_key is None:
+            return False
+        self._started = time.perf_counter()
+        if cache.restore(self._cache_key, self.output):
+            self.cached = True
+            self.processes = []
+            self.codecs = []
+            return True
+        # the run appends to the output
+        self._cache_output = pathlib.Path(self.output)
+        self._cache_offset = self._cache_output.stat().st_size \
+            if self._cache_output.exists() else 0
+        return False
+
+    def _store_cached(self):
+        if self._cache_key is None or self.cached:
+            return
+        self.option('cache').store(
+            self._cache_key, self._cache_output, self._cache_offset)
+
+    def _cached_stats(self):
+        return PipelineStats([], wall=time.perf_counter() - self._started)
+
+    def _check_executables(self):
+        if not self.option('check_executables'):
+            return
+        if self.plan is not None and not isinstance(self.input, Merge):
+            # checked when compiled
+            return
+        self.pype.check_executables(self.input)
+
+    def _argv(self, commandline):
+        if self.plan is not None:
+            return list(self.plan.argv[commandline])
+        return shlex.split(commandline)
+
     def execute(self):
+        if self._restore_cached():
+            return
+        self._check_executables()
+        if self._fd_only():
+            self._execute_fds()
+            return
+        self._start_pools()
+        if isinstance(self.input, Sharded):
+            self._execute_sharded()
+            return
+        self._open_endpoints()
         links = [self.input]
         self.processes = []
+        shovels_in = []
+        shovels_out = []
+        last = len(self.grouped) - 1
         # create subprocesses first
         for i, (group, native) in enumerate(self.grouped):
             if not native:
                 proc_input = links[-1]
+                shovel_source = None
                 if proc_input is UNFILLED:
                     proc_input = subprocess.PIPE
-                proc_output = self.output \
-                    if i == len(self.grouped) - 1 else subprocess.PIPE
+                elif proc_input is not None and _fileno(proc_input) is None:
+                    # Python object as input: shovel it into a pipe
+                    shovel_source = proc_input
+                    proc_input = subprocess.PIPE
+                proc_output = self.output if i == last else subprocess.PIPE
+                shovel_sink = None
+                if proc_output is not None \
+                        and proc_output is not subprocess.PIPE \
+                        and _fileno(proc_output) is None:
+                    shovel_sink = proc_output
+                    proc_output = subprocess.PIPE
                 proc_stderr = self.err
                 proc = self._popen(proc_input, group, proc_output, proc_stderr)
-                if proc_input == subprocess.PIPE:
+                proc.stats = StageStats(proc.args, 'command')
+                if links[-1] is UNFILLED:
                     # overwrite the UNFILLED with the pipe
                     links[-1] = proc.stdin
+                elif shovel_source is not None:
+                    shovels_in.append(self._shovel(
+                        shovel_source, proc.stdin, close_sink=True))
+                elif i > 0 or (self.owned_input and proc_input is not None):
+                    # the pipe now belongs to the child:
+                    # closing it here lets SIGPIPE propagate upstream
+                    links[-1].close()
+                if shovel_sink is not None:
+                    shovels_out.append(self._shovel(
+                        proc.stdout, shovel_sink, close_source=True))
+                elif i == last and self.owned_output \
+                        and proc_output is not None:
+                    # lets the reader of the pipe see EOF
+                    proc_output.close()
                 links.append(proc.stdout)
                 self.processes.append(proc)
             else:
                 links.append(UNFILLED)
                 self.processes.append(UNFILLED)
-        if links[-1] == UNFILLED:
+        if links[-1] is UNFILLED or len(self.grouped) == 0:
             links[-1] = self.output
         # connect the gaps using PythonPipelineThread
         for i, (group, native) in enumerate(self.grouped):
@@ -213,40 +1684,303 @@ class Execute():
                 proc_input = links[i]
                 proc_output = links[i + 1]
                 proc_stderr = self.err
-                proc = PythonPipelineThread(proc_input, group, proc_output, stderr=proc_stderr)
+                proc = PythonPipelineThread(
+                    proc_input, group, proc_output,
+                    stderr=proc_stderr,
+                    binary=self.binary,
+                    threaded=bool(self.option('function_threads')),
+                    stoppable=self.stoppable,
+                    records=self._record_codec(),
+                    pools=self.pools,
+                    close_source=i > 0 or self.owned_input,
+                    close_sink=i < last or self.owned_output)
                 self.processes[i] = proc
             # else pass
+        self.processes = shovels_in + self.processes + shovels_out
+
+    def _fd_only(self):
+        """ Whether the pipeline consists of Commands between file
+        endpoints, so that it can be wired using file descriptors only """
+        if len(self.grouped) == 0 or self.owned_input or self.owned_output:
+            return False
+        if any(native for _, native in self.grouped):
+            return False
+        for endpoint, mode in ((self.input, 'r'), (self.output, 'a')):
+            if endpoint is None or isinstance(endpoint, Literal):
+                continue
+            if not isinstance(endpoint, (str, pathlib.PurePath)):
+                return False
+            codec = compression.find_codec(endpoint)
+            if codec is not None and (
+                    self.option('compression') == 'python'
+                    or codec.command(mode) is None):
+                return False
+        return True
+
+    def _execute_fds(self):
+        """ Fast path of execute for _fd_only pipelines.
+        Compressed endpoints become external codec stages,
+        all stages are connected by OS pipes, and no Python object
+        handles the data: this process only waits for the children. """
+        self._started = time.perf_counter()
+        self.codecs = []
+        self.err = self._normalize_endpoint(self.err, 'a', text=True)
+        stages = [(self._argv(command), 'command', command)
+                  for command, _ in self.grouped]
+        if isinstance(self.input, Literal):
+            self.input = self.input.open(binary=True)
+        elif self.input is not None:
+            path = pathlib.Path(self.input)
+            codec = compression.find_codec(path)
+            if codec is not None:
+                stages.insert(0, (
+                    shlex.split(codec.command('r')), 'decompress', None))
+            self.input = path.open('rb', buffering=0)
+        if self.output is not None:
+            path = pathlib.Path(self.output)
+            codec = compression.find_codec(path)
+            if codec is not None:
+                stages.append((
+                    shlex.split(codec.command('a')), 'compress', None))
+            self.output = path.open('ab', buffering=0)
+        self._input_size = _regular_file_size(self.input)
+        self._output_size = _regular_file_size(self.output)
+        self.processes = []
+        stdin = self.input
+        last = len(stages) - 1
+        for i, (argv, kind, command) in enumerate(stages):
+            if i < last:
+                read_fd, stdout = os.pipe()
+            else:
+                stdout = self.output
+            proc = self._launch(
+                argv, stdin, stdout, self.err, text=False, command=command)
+            proc.stats = StageStats(proc.args, kind)
+            if kind == 'command':
+                self.processes.append(proc)
+            else:
+                self.codecs.append(proc)
+            # the pipe ends now belong to the children
+            if i > 0:
+                os.close(stdin)
+            if i < last:
+                os.close(stdout)
+                stdin = read_fd
+
+    def _execute_sharded(self):
+        """ Starts a copy of the pipeline for each shard of the input,
+        writing into temporary files """
+        sharded = self.input
+        self._started = time.perf_counter()
+        self.processes = []
+        self.codecs = []
+        self._shard_dir = None
+        if self.output is not None:
+            tmpdir = sharded.tmpdir
+            if tmpdir is None and isinstance(
+                    self.output, (str, pathlib.PurePath)):
+                tmpdir = pathlib.Path(self.output).parent
+            self._shard_dir = pathlib.Path(tempfile.mkdtemp(
+                prefix='.pypedream-shards-', dir=tmpdir))
+        self.shards = []
+        for i, (start, end) in enumerate(sharded.ranges()):
+            output = None if self._shard_dir is None \
+                else self._shard_dir / str(i)
+            shard = Execute.create(
+                self.pype, sharded.open(start, end, self.binary), output,
+                plan=self.plan)
+            shard.owned_input = True
+            shard.cpus = self.cpus
+            shard.pools = self.pools
+            shard.execute()
+            self.shards.append(shard)
+
+    def _wait_sharded(self):
+        failed = []
+        stages = []
+        timed_out = False
+        if self.option('fail_fast') or self.option('timeout') is not None:
+            # a failing shard stops the other shards too
+            timed_out = self._supervise(list(itertools.chain.from_iterable(
+                shard.processes + shard.codecs for shard in self.shards)))
+        try:
+            for shard in self.shards:
+                try:
+                    shard.wait()
+                except TimeoutException as e:
+                    timed_out = True
+                    failed.extend(e.failed)
+                except RetcodeException as e:
+                    failed.extend(e.failed)
+                if shard.stats is not None:
+                    stages.extend(shard.stats.stages)
+            if len(failed) == 0 and self.output is not None:
+                failed.extend(self._concatenate_shards())
+        finally:
+            self._close_pools()
+            if self._shard_dir is not None:
+                shutil.rmtree(self._shard_dir, ignore_errors=True)
+        # the shards are not connected to each other
+        self.stats = PipelineStats([], wall=time.perf_counter() - self._started)
+        self.stats.stages = stages
+        if timed_out:
+            raise TimeoutException(
+                failed, self.option('timeout'), stats=self.stats)
+        if len(failed) > 0:
+            raise RetcodeException(failed, stats=self.stats)
+
+    def _concatenate_shards(self):
+        """ Copies the shard outputs in order into the output endpoint,
+        returning the failed compression helpers """
+        self.err = self._normalize_endpoint(self.err, 'a', text=True)
+        self.output = self._normalize_endpoint(self.output, 'a')
+        paths = [self._shard_dir / str(i) for i in range(len(self.shards))]
+        if callable(self.output):
+            files = [path.open('rb' if self.binary else 'r')
+                     for path in paths]
+            try:
+                stream = self.output(itertools.chain.from_iterable(files))
+                if stream is not None:
+                    for _ in stream:
+                        # consume stream
+                        pass
+            finally:
+                for fobj in files:
+                    fobj.close()
+        else:
+            mode = 'r' if isinstance(self.output, io.TextIOBase) else 'rb'
+            for path in paths:
+                with path.open(mode) as fobj:
+                    shutil.copyfileobj(fobj, self.output, CHUNK_SIZE)
+        self._close_endpoint(self.output)
+        failed = []
+        for proc in self.codecs:
+            retcode = self._wait_stage(proc)
+            if retcode != 0:
+                failed.append(_failure(
+                    proc.args, retcode, getattr(proc, 'stderr_ring', None)))
+        return failed
+
+    def _shovel(self, source, sink, **kwargs):
+        """ A PythonPipelineThread that copies data without transforms """
+        return PythonPipelineThread(
+            source, [], sink,
+            stderr=self.err, binary=self.binary, **kwargs)
 
     def _popen(self, proc_input, commandline, proc_output, proc_stderr):
         """ Use popen to create a subprocess """
-        commandline = shlex.split(commandline)
-        proc = subprocess.Popen(
-            commandline,
-            stdin=proc_input,
-            stdout=proc_output,
-            stderr=proc_stderr,
-            universal_newlines=True,
-            bufsize=-1)
+        return self._launch(
+            self._argv(commandline), proc_input, proc_output, proc_stderr,
+            text=not self.binary, command=commandline)
+
+    def _record_codec(self):
+        if self.option('records') is None:
+            return None
+        return records.find_record_codec(self.option('records'))
+
+    def _stderr_ring(self):
+        """ A StderrRing for a subprocess, if capture_stderr is set """
+        size = self.option('capture_stderr')
+        if not size:
+            return None
+        return StderrRing(size)
+
+    def _scheduling(self, command=None):
+        """ The Scheduling of a subprocess from the STAGE_OPTIONS
+        of the pipeline and of its Command, None if all are unset """
+        options = {name: self.option(name) for name in STAGE_OPTIONS}
+        if options['affinity'] is None:
+            options['affinity'] = self.cpus
+        options.update(getattr(command, 'stage_options', None) or {})
+        if all(value is None for value in options.values()):
+            return None
+        return scheduling.Scheduling(**options)
+
+    def _launch(self, argv, stdin, stdout, stderr, text, command=None):
+        """ Starts a subprocess using the configured launcher.
+        command is the command line of the stage, if it is a Command. """
+        setup = self._scheduling(command)
+        launch_argv = argv if setup is None else setup.argv(argv)
+        ring = self._stderr_ring()
+        if ring is not None:
+            stderr = ring.write_fd
+        try:
+            if self.option('launcher') == 'spawn' \
+                    and SpawnedProcess.supports(stdin, stdout, stderr):
+                proc = SpawnedProcess(
+                    launch_argv, stdin=stdin, stdout=stdout, stderr=stderr,
+                    text=text)
+            else:
+                proc = subprocess.Popen(
+                    launch_argv,
+                    stdin=stdin,
+                    stdout=stdout,
+                    stderr=stderr,
+                    universal_newlines=text,
+                    bufsize=-1)
+        finally:
+            if ring is not None:
+                ring.close_writer()
+        # reported without the scheduling prefix
+        proc.args = argv
+        proc.stderr_ring = ring
         return proc
 
-    def _normalize_endpoint(self, endpoint, mode):
+    def _normalize_endpoint(self, endpoint, mode, text=False):
         ## handle various endpoints
+        binary = (self.binary or self.binary_endpoints) and not text
         # turn strings into pathlib.Path
         if isinstance(endpoint, str):
             endpoint = pathlib.Path(endpoint)
         if isinstance(endpoint, pathlib.Path):
             # transparently decompress
-            # TODO: other compression formats
-            if str(endpoint).endswith('.gz'):
-                endpoint = gzip.open(endpoint, mode)
+            codec = compression.find_codec(endpoint)
+            if codec is not None:
+                endpoint = self._open_compressed(
+                    endpoint, codec, mode, binary)
             else:
-                endpoint = endpoint.open(mode)
+                endpoint = endpoint.open(mode + ('b' if binary else 't'))
+        elif isinstance(endpoint, Merge):
+            endpoint = endpoint.open(self)
+        elif isinstance(endpoint, Literal):
+            endpoint = endpoint.open(binary)
+        elif binary and endpoint in (sys.stdin, sys.stdout):
+            endpoint = endpoint.buffer
         # file handles: nothing needed
         # callables, iterables: nothing needed?
         return endpoint
 
+    def _open_compressed(self, path, codec, mode, binary):
+        """ Opens a compressed file endpoint.
+        A helper process is connected with a pipe, which subprocesses
+        use directly. """
+        method = self.option('compression')
+        commandline = None
+        if method != 'python':
+            commandline = codec.command(mode)
+            if commandline is None and method == 'external':
+                raise Exception(
+                    'No executable found for {} compression: '
+                    'tried {}'.format(
+                        codec.suffix, codec.decompress + codec.compress))
+        if commandline is None:
+            return codec.open(path, mode + ('b' if binary else 't'))
+        reading = 'r' in mode
+        with path.open(mode + 'b') as fobj:
+            proc = self._launch(
+                shlex.split(commandline),
+                fobj if reading else subprocess.PIPE,
+                subprocess.PIPE if reading else fobj,
+                self.err,
+                text=not binary)
+        proc.stats = StageStats(
+            proc.args, 'decompress' if reading else 'compress')
+        self.codecs.append(proc)
+        return proc.stdout if reading else proc.stdin
+
     def _close_endpoint(self, endpoint):
-        if endpoint in (sys.stdin, sys.stdout):
+        if endpoint in (sys.stdin, sys.stdout,
+                        sys.stdin.buffer, sys.stdout.buffer):
             # don't close standard streams
             return
         try:
@@ -254,7 +1988,8 @@ class Execute():
         except AttributeError:
             pass
 
-    def _group_commands(self, commands):
+    @staticmethod
+    def _group_commands(commands):
         current = []
         for command in commands:
             if callable(command):
@@ -269,73 +2004,339 @@ class Execute():
         if len(current) > 0:
             yield current, True
 
+    def _wait_stage(self, proc):
+        """ Waits for a subprocess or thread, returning the return code.
+        Threads of a stopped pipeline are given TERMINATE_GRACE seconds,
+        and have the return code None if still running. """
+        if _is_subprocess(proc):
+            retcode, rusage = wait_with_rusage(proc)
+            proc.stats.finish(retcode, rusage)
+            return retcode
+        if self.stopped:
+            return proc.wait(TERMINATE_GRACE)
+        return proc.wait()
+
+    def _collect_stats(self, stages):
+        """ Stats of all stages, in data flow order """
+        codec_stats = [proc.stats for proc in self.codecs]
+        flow = [stats for stats in codec_stats if stats.kind == 'decompress']
+        flow.extend(stages)
+        flow.extend(stats for stats in codec_stats if stats.kind == 'compress')
+        if len(flow) > 0 and self._input_size is not None \
+                and flow[0].bytes_in is None:
+            flow[0].bytes_in = self._input_size
+        if self._output_size is not None and flow[-1].bytes_out is None:
+            try:
+                self.output.flush()
+            except (AttributeError, OSError, ValueError):
+                pass
+            size = _regular_file_size(self.output)
+            if size is not None:
+                flow[-1].bytes_out = size - self._output_size
+        return PipelineStats(flow, wall=time.perf_counter() - self._started)
+
     def wait(self):
         """ Wait for the entire pipeline to finish """
+        if self.cached:
+            self.stats = self._cached_stats()
+            return
+        if isinstance(self.input, Sharded):
+            self._wait_sharded()
+            return
+        timed_out = False
+        if self.option('fail_fast') or self.option('timeout') is not None:
+            timed_out = self._supervise(self.processes + self.codecs)
         failed = []
         # Wait for the subprocesses to exit
         for proc in self.processes:
-            retcode = proc.wait()
+            retcode = self._wait_stage(proc)
             if retcode != 0:
-                failed.append((proc.args, retcode))
+                failed.append(_failure(
+                    proc.args, retcode, getattr(proc, 'stderr_ring', None)))
+                exception = getattr(proc, 'exception', None)
+                if isinstance(exception, RetcodeException):
+                    # e.g. failed Tee branches
+                    failed.extend(exception.failed)
+        self._close_pools()
+        self.stats = self._collect_stats(
+            [proc.stats for proc in self.processes])
         # Close endpoints if needed
         self._close_endpoint(self.input)
         self._close_endpoint(self.output)
+        # compression helpers exit after their endpoint is closed
+        for proc in self.codecs:
+            retcode = self._wait_stage(proc)
+            if retcode != 0:
+                failed.append(_failure(
+                    proc.args, retcode, getattr(proc, 'stderr_ring', None)))
+        if self._killer is not None:
+            self._killer.cancel()
+        if timed_out:
+            raise TimeoutException(
+                failed, self.option('timeout'), stats=self.stats)
         if len(failed) > 0:
-            raise RetcodeException(failed)
+            raise RetcodeException(failed, stats=self.stats)
+        self._store_cached()
+
+
+def _read_lines(execution, pipe):
+    """ Yields the lines from pipe, then waits for execution.
+    Does not refer to the LineIterator, so that abandoning the loop
+    frees the generator, stopping the pipeline right away. """
+    exhausted = False
+    try:
+        # chain hides the close method of the pipe from yield from
+        yield from itertools.chain(pipe)
+        exhausted = True
+    finally:
+        _finish_lines(execution, pipe, exhausted)
+
+
+def _finish_lines(execution, pipe, exhausted):
+    if pipe.closed:
+        # already finished
+        return
+    if not exhausted:
+        # before closing the pipe, so that broken pipes are expected.
+        # Inline, as this also runs when the generator is finalized
+        # at interpreter shutdown, when threads can not be started.
+        execution._stop_inline()
+    pipe.close()
+    try:
+        execution.wait()
+    except RetcodeException as e:
+        execution.exception = e
+        if exhausted:
+            raise
+
+
+class LineIterator():
+    """ The output lines of a running pipeline, see PypeComponent.lines.
+
+    When the lines are exhausted, the pipeline is waited for,
+    raising a RetcodeException if it failed. Closing the iterator
+    before that, or leaving the loop, stops the pipeline instead:
+    its failures are then only stored in the exception attribute. """
+    def __init__(self, execution, pipe):
+        self.execution = execution
+        self._pipe = pipe
+        self._lines = _read_lines(execution, pipe)
+
+    def __iter__(self):
+        # the for loop runs the generator directly
+        return self._lines
+
+    def __next__(self):
+        return next(self._lines)
+
+    @property
+    def exception(self):
+        return self.execution.exception
+
+    @property
+    def stats(self):
+        """ PipelineStats of the execution, once it has finished """
+        return self.execution.stats
+
+    def close(self):
+        """ Stops the pipeline, unless all lines have been read """
+        self._lines.close()
+        # if iteration never started
+        _finish_lines(self.execution, self._pipe, False)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __repr__(self):
+        return '{}({})'.format(self.__class__.__name__, self.execution.pype)
 
 
 class PythonPipelineThread(threading.Thread):
     """ Executes a part of a pipeline
     written directly in the python script """
-    def __init__(self, source, transforms, sink, *args, stderr=None, **kwargs):
+    def __init__(self, source, transforms, sink, *args, stderr=None,
+                 binary=False, threaded=False, stoppable=False,
+                 records=None, pools=None, close_source=False,
+                 close_sink=False, on_exit=None, **kwargs):
         self.source = source
-        self.transforms = transforms
+        self.transforms = list(transforms)
         self.sink = sink
         self.stderr = stderr
+        self.binary = binary
+        self.threaded = threaded
+        # check for stop requests on every line, not only every chunk
+        self.stoppable = stoppable
+        self.stopping = threading.Event()
+        # RecordCodec used at file-like sources and sinks
+        self.records = records
+        # worker pools of Functions using processes, see Transform
+        self.pools = pools
+        self._threaded_stages = []
+        self.close_source = close_source
+        self.close_sink = close_sink
         self.exception = None
+        self.on_exit = on_exit
+        self._wrappers = []
+        self.tee = None
+        if len(self.transforms) == 1 \
+                and isinstance(self.transforms[0], TeeTransform):
+            # a lone Tee copies chunks, without decoding
+            self.tee = self.transforms.pop()
         if callable(self.sink):
             # callable sinks work better as part of transform
             self.transforms.append(self.sink)
             self.sink = None
-        if all(x is None for x in (self.source, self.sink)):
+        if self.binary and len(self.transforms) > 0:
+            # Functions work on lines of text: decode only here
+            self.source = self._text_wrap(self.source)
+            self.sink = self._text_wrap(self.sink)
+        if self.tee is not None:
+            self.thread_target = self._tee
+        elif all(x is None for x in (self.source, self.sink)):
             self.thread_target = self._no_pipes
         elif self.source is None:
             self.thread_target = self._shovel_in
         elif self.sink is None:
             self.thread_target = self._shovel_out
+        elif len(self.transforms) == 0:
+            self.thread_target = self._copy
         else:
             self.thread_target = self._shovel_through
+        self.stats = StageStats(
+            self.args, 'copy' if self.args == ['<copy>'] else 'python')
+        self._lines_in = None
         super().__init__(target=self._target_with_catch)
         self.start()
 
+    def _text_wrap(self, stream):
+        if not isinstance(stream, (io.RawIOBase, io.BufferedIOBase)):
+            return stream
+        wrapper = io.TextIOWrapper(stream)
+        self._wrappers.append(wrapper)
+        return wrapper
+
     def _target_with_catch(self):
+        rusage_before = thread_rusage()
         try:
             self.thread_target()
+        except _Stopped as e:
+            # not an error of the Functions: no traceback
+            self.exception = e
         except Exception as e:
             self.exception = e
-            raise e
+            if not self.stopping.is_set():
+                # e.g. broken pipes are expected when stopped
+                raise e
+        finally:
+            for stage in self._threaded_stages:
+                stage.stop()
+            self._release()
+            self._finish_stats(rusage_before)
+            if self.on_exit is not None:
+                self.on_exit(self)
+
+    def _finish_stats(self, rusage_before):
+        self.stats.finish(0 if self.exception is None else 1)
+        if self._lines_in is not None:
+            self.stats.lines_in = next(self._lines_in)
+        rusage = thread_rusage()
+        if rusage is not None:
+            self.stats.user = rusage.ru_utime - rusage_before.ru_utime
+            self.stats.sys = rusage.ru_stime - rusage_before.ru_stime
+        else:
+            self.stats.user = time.thread_time()
+
+    def _release(self):
+        """ Close pipes owned by this thread,
+        so that the neighbouring processes see EOF """
+        for stream, close in ((self.sink, self.close_sink),
+                              (self.source, self.close_source)):
+            if stream is None:
+                continue
+            try:
+                if close:
+                    stream.close()
+                elif stream in self._wrappers:
+                    # the endpoint is closed by Execute, not the wrapper
+                    stream.detach()
+            except (OSError, ValueError):
+                # e.g. downstream process already exited
+                pass
 
     def _apply_transform(self, stream=None):
+        """ Chains the transforms into a single generator.
+        Sets self.batched if the resulting stream yields lists of lines. """
         if self.stderr is not None:
             cm = contextlib.redirect_stderr(self.stderr)
         else:
             cm = contextlib.nullcontext()
+        batched = False
+        if stream is not None:
+            if self.stoppable:
+                stream = _until_stopped(stream, self.stopping)
+            self._lines_in = itertools.count()
+            stream = _counted(stream, self._lines_in)
+            if self.records is not None and hasattr(self.source, 'read'):
+                stream = self.records.decode(stream)
         with cm:
-            for transform in self.transforms:
+            for i, transform in enumerate(self.transforms):
+                if self.threaded and i > 0 and stream is not None:
+                    # the previous transforms run in a thread of their own
+                    stage = _ThreadedStage(
+                        stream, 1 if batched else QUEUE_CHUNK_LINES)
+                    self._threaded_stages.append(stage)
+                    stream = iter(stage)
+                size = getattr(transform, 'batch', None)
+                if stream is not None:
+                    # convert between lines and batches when needed
+                    if size is not None and not batched:
+                        stream = _batches(stream, size)
+                    elif size is None and batched:
+                        stream = itertools.chain.from_iterable(stream)
+                kwargs = {}
+                if isinstance(transform, (Transform, TeeTransform)):
+                    kwargs['pools'] = self.pools
                 if stream is None:
-                    stream = transform()
+                    stream = transform(**kwargs)
                 else:
-                    stream = transform(stream)
+                    stream = transform(stream, **kwargs)
+                batched = size is not None
+        if self.records is not None and self.sink is not None \
+                and stream is not None:
+            if batched:
+                stream = itertools.chain.from_iterable(stream)
+                batched = False
+            stream = self.records.encode(stream)
+        if self.stoppable and stream is not None:
+            stream = _until_stopped(stream, self.stopping)
+        self.batched = batched
         return stream
 
+    def _write_stream(self, stream):
+        if self.batched:
+            lines = 0
+            for batch in stream:
+                self.sink.writelines(batch)
+                lines += len(batch)
+        else:
+            counter = itertools.count()
+            self.sink.writelines(_counted(stream, counter))
+            lines = next(counter)
+        self.stats.lines_out = lines
+
     def _no_pipes(self):
-        for _ in self._apply_transform():
+        stream = self._apply_transform()
+        if stream is None:
+            return
+        for _ in stream:
             # consume stream
             pass
 
     def _shovel_in(self):
-        for line in self._apply_transform():
-            self.sink.write(line)
+        self._write_stream(self._apply_transform())
 
     def _shovel_out(self):
         stream = self._apply_transform(self.source)
@@ -346,14 +2347,72 @@ class PythonPipelineThread(threading.Thread):
             pass
 
     def _shovel_through(self):
-        for line in self._apply_transform(self.source):
-            self.sink.write(line)
+        self._write_stream(self._apply_transform(self.source))
 
-    def wait(self):
+    def _copy(self):
+        self._copy_to(self.sink)
+
+    def _copy_to(self, sink):
+        """ Moves data through unchanged, in large chunks if possible """
+        readinto = getattr(self.source, 'readinto1', None) \
+            or getattr(self.source, 'readinto', None)
+        n_lines = 0
+        total_bytes = None
+        if self.binary and readinto is not None:
+            total_bytes = 0
+            buf_array = bytearray(CHUNK_SIZE)
+            buf = memoryview(buf_array)
+            while True:
+                n_bytes = readinto(buf)
+                if not n_bytes:
+                    break
+                if self.stopping.is_set():
+                    raise _Stopped()
+                sink.write(buf[:n_bytes])
+                total_bytes += n_bytes
+                n_lines += buf_array.count(b'\n', 0, n_bytes)
+        elif hasattr(self.source, 'read'):
+            while True:
+                chunk = self.source.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                if self.stopping.is_set():
+                    raise _Stopped()
+                sink.write(chunk)
+                n_lines += chunk.count('\n' if isinstance(chunk, str) else b'\n')
+        else:
+            # iterables
+            counter = itertools.count()
+            sink.writelines(_counted(self.source, counter))
+            n_lines = next(counter)
+        self.stats.lines_in = self.stats.lines_out = n_lines
+        self.stats.bytes_in = self.stats.bytes_out = total_bytes
+
+    def _tee(self):
+        started = self.tee.open_branches(self.binary, pools=self.pools)
+        sinks = [writer for _, writer in started]
+        if self.sink is not None:
+            sinks.append(self.sink)
+        failed = True
+        try:
+            self._copy_to(_Fanout(sinks, functools.partial(
+                self.tee.branch_closed, started)))
+            failed = False
+        finally:
+            self.tee.close_branches(started, failed=failed)
+
+    def stop(self):
+        """ Asks the thread to stop, raising in the Functions """
+        self.stopping.set()
+
+    def wait(self, timeout=None):
         """ Join this thread.
         Named wait for consistency with Popen.
-        Returns 0 on success, 1 if the thread raised an Exception. """
-        self.join()
+        Returns 0 on success, 1 if the thread raised an Exception,
+        None if still running after timeout seconds. """
+        self.join(timeout)
+        if self.is_alive():
+            return None
         if self.exception is None:
             return 0
         else:
@@ -361,29 +2420,781 @@ class PythonPipelineThread(threading.Thread):
 
     @property
     def args(self):
+        if self.tee is not None:
+            return [self.tee.__name__]
+        if len(self.transforms) == 0:
+            return ['<copy>']
         return [x.__name__ for x in self.transforms]
 
 
+class AsyncExecute(Execute):
+    """ Executes a pipeline as a coroutine on an asyncio event loop.
+
+    Commands are started using asyncio.create_subprocess_exec,
+    and consecutive Commands are connected directly with OS pipes.
+    Functions that are async generator functions run on the event loop,
+    so that many pipelines can share a single thread.
+    Functions that are plain generators still get a thread of their own.
+    """
+    # subprocess streams are bytes: Function groups decode lines
+    binary_endpoints = True
+
+    def __init__(self, pype, input=UNFILLED, output=UNFILLED, plan=None):
+        input = pype.input if input is UNFILLED else input
+        output = pype.output if output is UNFILLED else output
+        self._prepare(
+            pype,
+            None if input is UNFILLED else input,
+            None if output is UNFILLED else output,
+            plan=plan)
+        self.encoding = locale.getpreferredencoding(False)
+        if callable(self.output):
+            # callable sinks work better as part of transform
+            self.grouped = list(self._group_commands(
+                pype.commands + [self.output]))
+            self.output = None
+
+    def _kind(self, group, native):
+        if not native:
+            return 'command'
+        funcs = [getattr(x, 'func', x) for x in group]
+        is_async = [inspect.isasyncgenfunction(func)
+                    or inspect.iscoroutinefunction(func)
+                    for func in funcs]
+        if all(is_async):
+            return 'async'
+        if any(is_async):
+            raise Exception(
+                'Async and plain generator Functions must be separated '
+                'by a Command: {}'.format(group))
+        return 'sync'
+
+    async def run(self):
+        """ Executes the pipeline.
+        Raises RetcodeException if any part of it fails. """
+        loop = asyncio.get_running_loop()
+        if self._restore_cached():
+            self.stats = self._cached_stats()
+            return self.stats
+        self._check_executables()
+        if isinstance(self.input, Sharded):
+            raise Exception(
+                'Sharded input is not supported by the async engine')
+        self._start_pools()
+        self._open_endpoints()
+        kinds = [self._kind(group, native)
+                 for group, native in self.grouped]
+        last = len(kinds) - 1
+        # async Functions write into the asyncio stdin of the next Command,
+        # everything else is connected using OS pipes
+        pipes = {i: os.pipe() for i in range(last) if kinds[i] != 'async'}
+        procs = {}
+        # (StageStats, awaitable return code) for each stage,
+        # in pipeline order
+        stages = [[] for _ in kinds]
+        # captured stderr of Commands, by id of their StageStats
+        rings = {}
+        threads = []
+        # create subprocesses first
+        for i, (group, native) in enumerate(self.grouped):
+            if native:
+                continue
+            copy_in = copy_out = False
+            if i == 0:
+                stdin = self.input
+                if stdin is not None and _fileno(stdin) is None:
+                    copy_in = True
+                    stdin = asyncio.subprocess.PIPE
+            elif i - 1 in pipes:
+                stdin = pipes[i - 1][0]
+            else:
+                stdin = asyncio.subprocess.PIPE
+            if i < last:
+                stdout = pipes[i][1]
+            else:
+                stdout = self.output
+                if stdout is not None and _fileno(stdout) is None:
+                    copy_out = True
+                    out_read, stdout = os.pipe()
+            commandline = self._argv(group)
+            setup = self._scheduling(group)
+            ring = self._stderr_ring()
+            try:
+                proc = await asyncio.create_subprocess_exec(
+                    *(commandline if setup is None
+                      else setup.argv(commandline)),
+                    stdin=stdin,
+                    stdout=stdout,
+                    stderr=self.err if ring is None else ring.write_fd)
+            finally:
+                if ring is not None:
+                    ring.close_writer()
+            procs[i] = proc
+            if copy_in:
+                stages[i].append((StageStats(['<copy>'], 'copy'),
+                                  self._retcode(self._copy_in(
+                                      self.input, proc.stdin))))
+            stage_stats = StageStats(commandline, 'command')
+            rings[id(stage_stats)] = ring
+            stages[i].append((stage_stats, proc.wait()))
+            if copy_out:
+                os.close(stdout)
+                stages[i].append((StageStats(['<copy>'], 'copy'),
+                                  self._retcode(self._copy_out(
+                                      out_read, self.output))))
+        # the pipe ends given to the children are not needed here
+        for i, (read_fd, write_fd) in pipes.items():
+            if kinds[i] == 'command':
+                os.close(write_fd)
+            if kinds[i + 1] == 'command':
+                os.close(read_fd)
+        # connect the gaps using Python
+        for i, (group, native) in enumerate(self.grouped):
+            names = [x.__name__ for x in group] if native else None
+            if kinds[i] == 'async':
+                if i == 0:
+                    source = self.input
+                else:
+                    source = pipes[i - 1][0]
+                sink = self.output if i == last else procs[i + 1].stdin
+                stages[i].append((StageStats(names, 'python'),
+                                  self._retcode(self._run_group(
+                                      group, source, sink, i > 0))))
+            elif kinds[i] == 'sync':
+                source = self.input if i == 0 \
+                    else open(pipes[i - 1][0], 'rb')
+                sink = self.output if i == last \
+                    else open(pipes[i][1], 'wb')
+                done = loop.create_future()
+                thread = PythonPipelineThread(
+                    source, group, sink,
+                    stderr=self.err,
+                    binary=True,
+                    threaded=bool(self.option('function_threads')),
+                    stoppable=self.stoppable,
+                    records=self._record_codec(),
+                    pools=self.pools,
+                    close_source=i > 0,
+                    close_sink=i < last,
+                    on_exit=lambda thread, done=done: self._resolve(
+                        loop, done, 0 if thread.exception is None else 1))
+                threads.append(thread)
+                stages[i].append((thread.stats, done))
+        stages = list(itertools.chain.from_iterable(stages))
+        timed_out = False
+        if self.option('fail_fast') or self.option('timeout') is not None:
+            retcodes, timed_out = await self._supervise_stages(
+                stages, list(procs.values()), threads)
+        else:
+            retcodes = await asyncio.gather(*(
+                self._timed(stage_stats, awaitable)
+                for stage_stats, awaitable in stages))
+        failed = [_failure(stage_stats.args, retcode,
+                           rings.get(id(stage_stats)))
+                  for (stage_stats, _), retcode in zip(stages, retcodes)
+                  if retcode != 0]
+        self._close_pools()
+        self.stats = self._collect_stats(
+            [stage_stats for stage_stats, _ in stages])
+        # Close endpoints if needed
+        self._close_endpoint(self.input)
+        self._close_endpoint(self.output)
+        # compression helpers exit after their endpoint is closed
+        for proc in self.codecs:
+            retcode = await loop.run_in_executor(
+                None, self._wait_stage, proc)
+            if retcode != 0:
+                failed.append(_failure(
+                    proc.args, retcode, getattr(proc, 'stderr_ring', None)))
+        if timed_out:
+            raise TimeoutException(
+                failed, self.option('timeout'), stats=self.stats)
+        if len(failed) > 0:
+            raise RetcodeException(failed, stats=self.stats)
+        self._store_cached()
+        return self.stats
+
+    async def _supervise_stages(self, stages, procs, threads):
+        """ Awaits the stages like gather, but stops the pipeline at the
+        first failure if fail_fast is set, or when the timeout is reached.
+        Subprocesses get SIGTERM, then SIGKILL after TERMINATE_GRACE
+        seconds, after which the remaining Python stages are cancelled,
+        with the return code None.
+        Returns the return codes, and whether the timeout was reached. """
+        fail_fast = self.option('fail_fast')
+        timeout = self.option('timeout')
+        deadline = None if timeout is None else self._started + timeout
+        tasks = [asyncio.ensure_future(self._timed(stage_stats, awaitable))
+                 for stage_stats, awaitable in stages]
+        pending = set(tasks)
+        timed_out = False
+        while len(pending) > 0:
+            remaining = None if deadline is None \
+                else max(0, deadline - time.perf_counter())
+            done, pending = await asyncio.wait(
+                pending, timeout=remaining,
+                return_when=asyncio.FIRST_COMPLETED)
+            if len(done) == 0:
+                timed_out = True
+                break
+            if fail_fast and any(task.result() != 0 for task in done):
+                break
+        for sig in (signal.SIGTERM, signal.SIGKILL):
+            if len(pending) == 0:
+                break
+            self.stopped = True
+            for thread in threads:
+                thread.stop()
+            for proc in procs:
+                if proc.returncode is None:
+                    try:
+                        proc.send_signal(sig)
+                    except ProcessLookupError:
+                        pass
+            for proc in self.codecs:
+                if _exit_status(proc) is None:
+                    proc.send_signal(sig)
+            _, pending = await asyncio.wait(pending, timeout=TERMINATE_GRACE)
+        for task in pending:
+            task.cancel()
+        if len(pending) > 0:
+            await asyncio.wait(pending)
+        retcodes = []
+        for (stage_stats, _), task in zip(stages, tasks):
+            if task.cancelled():
+                stage_stats.finish(None)
+                retcodes.append(None)
+            else:
+                retcodes.append(task.result())
+        return retcodes, timed_out
+
+    @staticmethod
+    def _resolve(loop, future, retcode):
+        """ Passes the return code of a thread to the event loop """
+        def resolve():
+            if not future.done():
+                # i.e. not cancelled by _supervise_stages
+                future.set_result(retcode)
+        try:
+            loop.call_soon_threadsafe(resolve)
+        except RuntimeError:
+            # the event loop has already finished
+            pass
+
+    async def _timed(self, stage_stats, awaitable):
+        retcode = await awaitable
+        if stage_stats.retcode is None:
+            # threads record their own stats
+            stage_stats.finish(retcode)
+        return retcode
+
+    async def _retcode(self, coroutine):
+        """ Return code of a Python part of the pipeline """
+        try:
+            await coroutine
+        except Exception:
+            traceback.print_exc()
+            return 1
+        return 0
+
+    async def _read_pipe(self, fd):
+        """ Wraps the read end of an OS pipe into a StreamReader """
+        loop = asyncio.get_running_loop()
+        reader = asyncio.StreamReader(limit=CHUNK_SIZE)
+        transport, _ = await loop.connect_read_pipe(
+            lambda: asyncio.StreamReaderProtocol(reader),
+            open(fd, 'rb', buffering=0))
+        return reader, transport
+
+    def _decode(self, line):
+        if isinstance(line, bytes):
+            return line.decode(self.encoding)
+        return line
+
+    def _encode(self, line):
+        if isinstance(line, str):
+            return line.encode(self.encoding)
+        return line
+
+    async def _lines(self, source):
+        """ Lines of text from a source, as an async iterator """
+        if not hasattr(source, '__aiter__'):
+            source = self._threaded_lines(source)
+        async for line in source:
+            yield self._decode(line)
+
+    async def _threaded_lines(self, source):
+        """ Lines from a file-like or iterable source, e.g. a plain file,
+        Literal, Merge or stdin. They are read in chunks in a thread,
+        so that a slow source does not block the event loop. """
+        loop = asyncio.get_running_loop()
+        chunks = _line_chunks(source)
+        while True:
+            chunk = await loop.run_in_executor(None, next, chunks, None)
+            if chunk is None:
+                break
+            for line in chunk:
+                yield line
+
+    async def _threaded_write(self, stream, sink):
+        """ Writes lines into a file-like sink from a thread, so that
+        a slow sink does not block the event loop. Lines arriving
+        while a write is in progress are written together. """
+        loop = asyncio.get_running_loop()
+        text = isinstance(sink, io.TextIOBase)
+        lines = asyncio.Queue(QUEUE_CHUNK_LINES)
+
+        async def produce():
+            try:
+                async for line in stream:
+                    await lines.put(line if text else self._encode(line))
+            finally:
+                # end of stream
+                await lines.put(None)
+
+        producer = asyncio.ensure_future(produce())
+        try:
+            finished = False
+            while not finished:
+                chunk = [await lines.get()]
+                while not lines.empty() and len(chunk) < QUEUE_CHUNK_LINES:
+                    chunk.append(lines.get_nowait())
+                if chunk[-1] is None:
+                    chunk.pop()
+                    finished = True
+                if len(chunk) > 0:
+                    data = ('' if text else b'').join(chunk)
+                    await loop.run_in_executor(None, sink.write, data)
+            # raises the errors of the Functions
+            await producer
+        finally:
+            producer.cancel()
+
+    async def _run_group(self, group, source, sink, source_is_pipe):
+        transport = None
+        if source_is_pipe:
+            source, transport = await self._read_pipe(source)
+        stream = None if source is None else self._lines(source)
+        codec = self._record_codec()
+        if codec is not None and hasattr(source, 'read'):
+            stream = self._map_lines(codec.decode_line, stream)
+        try:
+            for transform in group:
+                if stream is None:
+                    stream = transform()
+                else:
+                    stream = transform(stream)
+            if codec is not None and sink is not None \
+                    and not inspect.isawaitable(stream):
+                stream = self._map_lines(codec.encode_record, stream)
+            if inspect.isawaitable(stream):
+                # async def sink consuming the lines
+                await stream
+            elif sink is None:
+                async for _ in stream:
+                    # consume stream
+                    pass
+            elif isinstance(sink, asyncio.StreamWriter):
+                async for line in stream:
+                    sink.write(self._encode(line))
+                    await sink.drain()
+            else:
+                await self._threaded_write(stream, sink)
+        finally:
+            if transport is not None:
+                transport.close()
+            if isinstance(sink, asyncio.StreamWriter):
+                sink.close()
+
+    async def _map_lines(self, func, stream):
+        async for item in stream:
+            yield func(item)
+
+    async def _copy_in(self, source, writer):
+        """ Feeds a Python object into the stdin of a subprocess """
+        loop = asyncio.get_running_loop()
+        try:
+            if hasattr(source, 'read'):
+                while True:
+                    chunk = await loop.run_in_executor(
+                        None, source.read, CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    writer.write(self._encode(chunk))
+                    await writer.drain()
+            elif hasattr(source, '__aiter__'):
+                async for line in source:
+                    writer.write(self._encode(line))
+                    await writer.drain()
+            else:
+                for line in source:
+                    writer.write(self._encode(line))
+                    await writer.drain()
+        finally:
+            writer.close()
+
+    async def _copy_out(self, fd, sink):
+        """ Moves the output of a subprocess into a Python object """
+        loop = asyncio.get_running_loop()
+        reader, transport = await self._read_pipe(fd)
+        if isinstance(sink, io.TextIOBase):
+            decoder = codecs.getincrementaldecoder(self.encoding)()
+            write = lambda chunk: sink.write(decoder.decode(chunk))
+        else:
+            write = sink.write
+        try:
+            while True:
+                chunk = await reader.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                # e.g. compression should not block the event loop
+                await loop.run_in_executor(None, write, chunk)
+        finally:
+            transport.close()
+
+
 class Parallel():
-    """ A grouping context for running pipelines in parallel """
-    def __init__(self):
+    """ A grouping context for running pipelines in parallel.
+
+    If max_jobs is given, at most that many pipelines run at a time,
+    and the rest are queued until a running pipeline finishes.
+    All pipelines are waited for before raising a RetcodeException
+    covering every failed pipeline. The outcome of each pipeline
+    is available as the exception attribute of self.pipelines.
+
+    With fail_fast, the first failing pipeline stops the running ones
+    (see Execute.stop), and the queued ones are not started.
+    With timeout, the pipelines still running timeout seconds after
+    entering the context are stopped, raising a TimeoutException.
+    The pipelines that were not started are listed in self.cancelled.
+
+    With spread, each running pipeline gets a group of adjacent CPUs
+    of its own (see scheduling.cpu_slots), used as the affinity of its
+    subprocesses unless the pipeline or Command sets one.
+    Without max_jobs, pipelines are pinned to one CPU each, in turn. """
+    def __init__(self, max_jobs=None, fail_fast=False, timeout=None,
+                 spread=False):
+        self.max_jobs = max_jobs
+        self.fail_fast = fail_fast
+        self.timeout = timeout
+        self._cpu_slots = scheduling.cpu_slots(max_jobs) if spread else None
         self.pipelines = []
+        self.cancelled = []
+        self._queue = queue.Queue()
+        self._workers = []
+        # threads waiting for unqueued pipelines, see _watched
+        self._waiters = []
+        self._running = set()
+        self._lock = threading.Lock()
+        self._stopping = False
+        self._timed_out = False
+        self._started = time.perf_counter()
+
+    @property
+    def _watched(self):
+        """ Whether pipelines are waited for as soon as they start,
+        rather than in order when the context exits """
+        return self.fail_fast or self.timeout is not None
 
     def add_pipeline(self, pipe):
         """ Called by Execute to add a pipeline to the context.
         Use the & operator rather than calling this directly. """
         self.pipelines.append(pipe)
+        if self._watched:
+            pipe.stoppable = True
+        if self.max_jobs is None:
+            if self._stopping:
+                self.cancelled.append(pipe)
+                return pipe
+            self._running.add(pipe)
+            if self._cpu_slots is not None:
+                pipe.cpus = self._cpu_slots[
+                    (len(self.pipelines) - 1) % len(self._cpu_slots)]
+            try:
+                pipe.execute()
+            except Exception as e:
+                self._finished(pipe, e)
+                return pipe
+            self._stop_if_stopping(pipe)
+            if self._watched:
+                waiter = threading.Thread(target=self._wait, args=(pipe,))
+                waiter.start()
+                self._waiters.append(waiter)
+        else:
+            if len(self._workers) < self.max_jobs:
+                worker = threading.Thread(
+                    target=self._worker, args=(len(self._workers),))
+                worker.start()
+                self._workers.append(worker)
+            self._queue.put(pipe)
         return pipe
 
+    def _wait(self, pipe):
+        try:
+            pipe.wait()
+        except Exception as e:
+            self._finished(pipe, e)
+        else:
+            self._finished(pipe)
+
+    def _worker(self, index):
+        """ Runs queued pipelines one at a time """
+        while True:
+            pipe = self._queue.get()
+            if pipe is None:
+                return
+            with self._lock:
+                if self._stopping:
+                    self.cancelled.append(pipe)
+                    continue
+                self._running.add(pipe)
+            if self._cpu_slots is not None:
+                pipe.cpus = self._cpu_slots[index]
+            try:
+                pipe.execute()
+                self._stop_if_stopping(pipe)
+                pipe.wait()
+            except Exception as e:
+                self._finished(pipe, e)
+            else:
+                self._finished(pipe)
+
+    def _stop_if_stopping(self, pipe):
+        # _stop may have run while pipe was starting
+        if self._stopping:
+            pipe.stop()
+
+    def _finished(self, pipe, exception=None):
+        with self._lock:
+            self._running.discard(pipe)
+        if exception is not None:
+            pipe.exception = exception
+            if self.fail_fast:
+                self._stop()
+
+    def _stop(self):
+        """ Stops the running pipelines, and cancels the queued ones """
+        with self._lock:
+            if self._stopping:
+                return
+            self._stopping = True
+            running = list(self._running)
+        for pipe in running:
+            pipe.stop()
+
+    def _join(self, threads):
+        """ Joins the threads, stopping everything at the timeout """
+        deadline = None if self.timeout is None \
+            else self._started + self.timeout
+        for thread in threads:
+            if deadline is not None:
+                thread.join(max(0, deadline - time.perf_counter()))
+                if thread.is_alive():
+                    self._timed_out = True
+                    self._stop()
+            thread.join()
+
+    @property
+    def failed(self):
+        """ The pipelines that have failed """
+        return [pipe for pipe in self.pipelines if pipe.exception is not None]
+
+    @property
+    def stats(self):
+        """ PipelineStats of each pipeline, None if not finished.
+        Use pypedream.stats.to_json to export them. """
+        return [pipe.stats for pipe in self.pipelines]
+
     def __enter__(self):
+        self._started = time.perf_counter()
         return ParallelPseudoCommand(self)
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         if exc_type is not None:
-            # don't run if execption was raised
+            # don't run queued pipelines if execption was raised
+            self._stop_workers(cancel=True)
             return
+        if self.max_jobs is None and not self._watched:
+            for pipe in self.pipelines:
+                if pipe.exception is not None:
+                    # failed to start
+                    continue
+                try:
+                    pipe.wait()
+                except Exception as e:
+                    pipe.exception = e
+        self._join(self._waiters)
+        self._stop_workers()
+        self._raise_failures()
+
+    def _raise_failures(self):
+        exceptions = [pipe.exception for pipe in self.failed]
+        for exception in exceptions:
+            if not isinstance(exception, RetcodeException):
+                raise exception
+        failed = list(itertools.chain.from_iterable(
+            exception.failed for exception in exceptions))
+        if self._timed_out:
+            raise TimeoutException(failed, self.timeout)
+        if len(exceptions) > 0:
+            raise RetcodeException(failed)
+
+    def _stop_workers(self, cancel=False):
+        if cancel:
+            while not self._queue.empty():
+                self._queue.get_nowait()
+        for _ in self._workers:
+            self._queue.put(None)
+        self._join(self._workers)
+        self._workers = []
+
+
+def _endpoint_paths(endpoint):
+    """ The files read or written by an endpoint, as absolute paths """
+    if isinstance(endpoint, (str, pathlib.PurePath)):
+        return [os.path.abspath(endpoint)]
+    if isinstance(endpoint, Sharded):
+        return [os.path.abspath(endpoint.path)]
+    if isinstance(endpoint, Merge):
+        paths = []
+        for source in endpoint.sources:
+            if isinstance(source, PypeComponent):
+                source = source.input
+            paths.extend(_endpoint_paths(source))
+        return paths
+    return []
+
+
+class Graph(Parallel):
+    """ A grouping context for running pipelines like make.
+
+    The pipelines are only registered when added with &.
+    They run when the context exits, in parallel up to max_jobs
+    (unlimited if None). A pipeline reading a file written by an
+    earlier pipeline of the graph waits for it to finish.
+
+    Pipelines whose output files exist and are newer than their
+    input files are skipped, unless force is set. Pipelines without
+    file outputs always run. The file outputs of a pipeline, including
+    those of its Tee branches, are removed before it runs, so that
+    they are rebuilt rather than appended to. The output of a failed
+    pipeline is removed, and the pipelines depending on it are not run.
+    The skipped pipelines are listed in self.up_to_date, and those
+    not run due to a failure in self.not_run. """
+    def __init__(self, max_jobs=None, force=False):
+        super().__init__(max_jobs=max_jobs)
+        self.force = force
+        self.up_to_date = []
+        self.not_run = []
+
+    def add_pipeline(self, pipe):
+        """ Called by Execute to add a pipeline to the graph.
+        Use the & operator rather than calling this directly. """
+        self.pipelines.append(pipe)
+        return pipe
+
+    @staticmethod
+    def inputs(pipe):
+        return _endpoint_paths(pipe.input)
+
+    @staticmethod
+    def outputs(pipe):
+        paths = _endpoint_paths(pipe.output)
+        for command in pipe.pype.commands:
+            if isinstance(command, TeeTransform):
+                for branch in command.branches:
+                    paths.extend(_endpoint_paths(branch.output))
+        return paths
+
+    def dependencies(self):
+        """ For each pipeline, the earlier pipelines writing its inputs """
+        writers = {}
+        deps = {}
         for pipe in self.pipelines:
-            pipe.wait()
+            deps[pipe] = {writers[path] for path in self.inputs(pipe)
+                          if path in writers}
+            for path in self.outputs(pipe):
+                writers[path] = pipe
+        return deps
+
+    def _is_up_to_date(self, pipe):
+        if self.force:
+            return False
+        outputs = self.outputs(pipe)
+        if len(outputs) == 0 or not all(
+                os.path.exists(path) for path in outputs):
+            return False
+        if pipe.input is not None and len(self.inputs(pipe)) == 0:
+            # e.g. reading from an iterable
+            return False
+        oldest_output = min(os.stat(path).st_mtime_ns for path in outputs)
+        return all(os.path.exists(path)
+                   and os.stat(path).st_mtime_ns <= oldest_output
+                   for path in self.inputs(pipe))
+
+    def _run(self, pipe):
+        pipe.execute()
+        pipe.wait()
+
+    def _schedule(self):
+        deps = self.dependencies()
+        waiting = list(self.pipelines)
+        running = {}
+        done = set()
+        max_workers = self.max_jobs or max(1, len(self.pipelines))
+        with futures.ThreadPoolExecutor(max_workers) as pool:
+            while len(waiting) > 0 or len(running) > 0:
+                for pipe in list(waiting):
+                    if any(dep in self.not_run or dep.exception is not None
+                           for dep in deps[pipe]):
+                        waiting.remove(pipe)
+                        self.not_run.append(pipe)
+                    elif deps[pipe] <= done:
+                        waiting.remove(pipe)
+                        if self._is_up_to_date(pipe):
+                            self.up_to_date.append(pipe)
+                            done.add(pipe)
+                        else:
+                            # outputs are opened for appending:
+                            # rebuild them instead of extending stale ones
+                            outputs = self.outputs(pipe)
+                            self._remove_outputs(outputs)
+                            running[pool.submit(self._run, pipe)] = \
+                                (pipe, outputs)
+                if len(running) == 0:
+                    continue
+                finished, _ = futures.wait(
+                    running, return_when=futures.FIRST_COMPLETED)
+                for future in finished:
+                    pipe, outputs = running.pop(future)
+                    try:
+                        future.result()
+                        done.add(pipe)
+                    except Exception as e:
+                        pipe.exception = e
+                        self._remove_outputs(outputs)
+
+    def _remove_outputs(self, outputs):
+        """ Removes the outputs of a pipeline before rebuilding them,
+        and after a failure, as partial outputs would look up to date
+        on the next run """
+        for path in outputs:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is not None:
+            # don't run anything if execption was raised
+            return
+        self._schedule()
+        self._raise_failures()
+
+
+def run_async(pype_component):
+    """ Awaitable version of run, using the async engine. """
+    return pype_component.run_async()
 
 
 def run(pype_component):
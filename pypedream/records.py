@@ -0,0 +1,141 @@
+"""
+Passing records instead of lines between Function stages
+"""
+
+import functools
+import operator
+
+from .pypedream import _LazyModule
+
+csv = _LazyModule('csv')
+json = _LazyModule('json')
+
+
+class RecordCodec():
+    """ Converts between lines of text and records, i.e. Python objects.
+
+    Enabled with the records pipeline option, e.g.
+    (cmd | Function(parse) | Function(score) | cmd).configure(records='tsv')
+    Functions then receive and yield records, which are decoded from
+    and encoded into lines only at Commands and file endpoints.
+    decode and encode work on whole streams, so that a codec can use
+    a C implementation, decode_line and encode_record on single items. """
+    def __init__(self, name, decode_line, encode_record):
+        self.name = name
+        self.decode_line = decode_line
+        self.encode_record = encode_record
+
+    def decode(self, lines):
+        """ Records from an iterable of lines """
+        return map(self.decode_line, lines)
+
+    def encode(self, records):
+        """ Lines from an iterable of records """
+        return map(self.encode_record, records)
+
+    def __repr__(self):
+        return '{}({})'.format(self.__class__.__name__, self.name)
+
+
+class CsvCodec(RecordCodec):
+    """ Records are lists of strings. Whole streams are read using
+    csv.reader, which also handles quoted newlines """
+    def __init__(self, name='csv', **fmtparams):
+        self.fmtparams = dict(fmtparams)
+        self.fmtparams.setdefault('lineterminator', '\n')
+        super().__init__(name, self._decode_line, self._encode_record)
+
+    def decode(self, lines):
+        return csv.reader(lines, **self.fmtparams)
+
+    def encode(self, records):
+        line = _LastWrite()
+        writer = csv.writer(line, **self.fmtparams)
+        for record in records:
+            writer.writerow(record)
+            yield line.value
+
+    def _decode_line(self, line):
+        return next(csv.reader([line], **self.fmtparams))
+
+    def _encode_record(self, record):
+        return next(self.encode([record]))
+
+
+class _LastWrite():
+    """ A file-like object keeping only the last write """
+    value = None
+
+    def write(self, value):
+        self.value = value
+
+
+def _decode_tsv(line):
+    return line.rstrip('\n').split('\t')
+
+
+def _encode_tsv(record):
+    return '\t'.join(map(str, record)) + '\n'
+
+
+class TsvCodec(RecordCodec):
+    """ Records are lists of strings split at tabs.
+    Encoding also accepts other sequences, converting fields to str """
+    def __init__(self, name='tsv'):
+        super().__init__(name, _decode_tsv, _encode_tsv)
+
+    def decode(self, lines):
+        # methodcaller keeps the per-line work in C
+        return map(operator.methodcaller('split', '\t'),
+                   map(operator.methodcaller('rstrip', '\n'), lines))
+
+
+def _encode_jsonl(dumps, record):
+    return dumps(record) + '\n'
+
+
+class JsonlCodec(RecordCodec):
+    """ Records are JSON values, one per line.
+    Keyword arguments are passed to json.JSONEncoder """
+    def __init__(self, name='jsonl', **dumps_kwargs):
+        self.dumps_kwargs = dumps_kwargs
+        super().__init__(name, self._decode_line, self._encode_record)
+
+    def decode(self, lines):
+        return map(json.loads, lines)
+
+    def encode(self, records):
+        dumps = json.JSONEncoder(**self.dumps_kwargs).encode
+        return map(functools.partial(_encode_jsonl, dumps), records)
+
+    def _decode_line(self, line):
+        return json.loads(line)
+
+    def _encode_record(self, record):
+        return json.dumps(record, **self.dumps_kwargs) + '\n'
+
+
+RECORD_CODECS = {}
+
+
+def register_record_codec(codec):
+    """ Adds or replaces the codec with the name of codec """
+    RECORD_CODECS[codec.name] = codec
+    return codec
+
+
+def find_record_codec(records):
+    """ The RecordCodec for the records option: a codec or its name """
+    if records is None or isinstance(records, RecordCodec):
+        return records
+    try:
+        return RECORD_CODECS[records]
+    except KeyError:
+        raise Exception(
+            'Unknown record codec "{}", registered: {}'.format(
+                records, ', '.join(sorted(RECORD_CODECS))))
+
+
+register_record_codec(TsvCodec())
+register_record_codec(CsvCodec())
+register_record_codec(JsonlCodec())
@@ -0,0 +1,146 @@
+"""
+CPU affinity, priority and resource limits of subprocesses
+"""
+
+import os
+
+from .pypedream import which
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows
+    resource = None
+
+# classes of the ionice executable
+IONICE_CLASSES = {'realtime': 1, 'best-effort': 2, 'idle': 3}
+
+
+def _executable(name, option):
+    executable = which(name)
+    if executable is None:
+        raise Exception('The {} option requires the {} executable'.format(
+            option, name))
+    return executable
+
+
+def _ionice_argv(ionice):
+    """ The ionice prefix for the ionice option: a best-effort level
+    from 0 (highest) to 7, a class name, or a (class, level) tuple """
+    if ionice is None:
+        return []
+    if isinstance(ionice, int):
+        ionice = ('best-effort', ionice)
+    elif isinstance(ionice, str):
+        ionice = (ionice, None)
+    name, level = ionice
+    if name not in IONICE_CLASSES:
+        raise Exception('Unknown ionice class "{}", expected one of {}'.format(
+            name, ', '.join(IONICE_CLASSES)))
+    argv = [_executable('ionice', 'ionice'), '-c', str(IONICE_CLASSES[name])]
+    if level is not None:
+        argv += ['-n', str(level)]
+    return argv
+
+
+def _rlimit_name(name):
+    """ The prlimit option name for e.g. 'as', 'RLIMIT_NOFILE'
+    or resource.RLIMIT_NOFILE """
+    if isinstance(name, int):
+        for attr in dir(resource):
+            if attr.startswith('RLIMIT_') and getattr(resource, attr) == name:
+                name = attr
+                break
+        else:
+            raise Exception('Unknown resource limit {}'.format(name))
+    name = name.upper()
+    if not name.startswith('RLIMIT_'):
+        name = 'RLIMIT_' + name
+    if not hasattr(resource, name):
+        raise Exception('Unknown resource limit "{}"'.format(name))
+    return name[len('RLIMIT_'):].lower()
+
+
+def _rlimit_value(limit):
+    if limit == resource.RLIM_INFINITY:
+        return 'unlimited'
+    return str(limit)
+
+
+def _prlimit_argv(rlimits):
+    """ The prlimit prefix for the rlimits option.
+    A single number sets the soft limit, keeping the hard limit. """
+    if not rlimits:
+        return []
+    if resource is None:
+        raise Exception('The rlimits option requires the resource module')
+    argv = [_executable('prlimit', 'rlimits')]
+    for name, limit in rlimits.items():
+        option = _rlimit_name(name)
+        if isinstance(limit, int):
+            _, hard = resource.getrlimit(getattr(
+                resource, 'RLIMIT_' + option.upper()))
+            if hard != resource.RLIM_INFINITY and limit > hard:
+                raise Exception(
+                    'Resource limit {} of {} exceeds the hard limit {}'.format(
+                        name, limit, hard))
+            limit = (limit, hard)
+        soft, hard = limit
+        argv.append('--{}={}:{}'.format(
+            option, _rlimit_value(soft), _rlimit_value(hard)))
+    return argv
+
+
+class Scheduling():
+    """ How the subprocess of a stage is scheduled, see STAGE_OPTIONS.
+
+    The options are applied by prefixing the command with the taskset,
+    nice, prlimit and ionice executables, which set them on themselves
+    before executing the next one. The command thus starts with all of
+    them in effect, no Python code runs between fork and exec, and the
+    spawn launcher can be used. Invalid values raise in the parent. """
+    def __init__(self, affinity=None, nice=None, ionice=None, rlimits=None):
+        self.prefix = []
+        self.affinity = None if affinity is None else sorted(set(affinity))
+        if self.affinity is not None:
+            self.prefix += [_executable('taskset', 'affinity'), '-c',
+                            ','.join(str(int(cpu)) for cpu in self.affinity)]
+        self.nice = nice
+        if nice:
+            # an increment of the current niceness
+            self.prefix += [_executable('nice', 'nice'), '-n', str(int(nice))]
+        self.prefix += _prlimit_argv(rlimits)
+        self.prefix += _ionice_argv(ionice)
+
+    def argv(self, argv):
+        """ argv prefixed with the executables applying the options """
+        if len(self.prefix) == 0:
+            return argv
+        return self.prefix + list(argv)
+
+    def __repr__(self):
+        return '{}({})'.format(self.__class__.__name__, self.prefix)
+
+
+def cpu_slots(jobs=None):
+    """ Divides the CPUs available to this process into jobs groups
+    of adjacent CPUs, which usually share caches and a NUMA node.
+    With more jobs than CPUs, each job gets a single CPU in turn.
+    By default, one group per CPU. """
+    if not hasattr(os, 'sched_getaffinity'):
+        raise Exception('Spreading jobs over CPUs is not supported '
+                        'on this platform')
+    cpus = sorted(os.sched_getaffinity(0))
+    if jobs is None:
+        jobs = len(cpus)
+    if jobs >= len(cpus):
+        return [[cpus[i % len(cpus)]] for i in range(jobs)]
+    # e.g. 8 CPUs for 3 jobs: 3 + 3 + 2
+    size, extra = divmod(len(cpus), jobs)
+    slots = []
+    start = 0
+    for i in range(jobs):
+        end = start + size + (1 if i < extra else 0)
+        slots.append(cpus[start:end])
+        start = end
+    return slots
@@ -0,0 +1,141 @@
+"""
+Runtime statistics of executed pipelines
+"""
+
+import os
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows
+    resource = None
+
+
+def _maxrss_bytes(rusage):
+    # ru_maxrss is in bytes on macOS, kilobytes elsewhere
+    if sys.platform == 'darwin':
+        return rusage.ru_maxrss
+    return rusage.ru_maxrss * 1024
+
+
+class StageStats():
+    """ Statistics of one stage of a pipeline: a subprocess,
+    or a thread running Functions or copying data.
+    Values that were not observed are None.
+
+    Subprocesses are measured using os.wait4, so CPU times and peak RSS
+    are those of the process itself. Threads report their own CPU time,
+    but no RSS, as memory is shared with the script.
+    Lines and bytes are counted where data passes through Python.
+    For subprocesses they are taken from the neighbouring stages,
+    and from the sizes of plain file endpoints. """
+    FIELDS = ('args', 'kind', 'retcode', 'wall', 'user', 'sys', 'maxrss',
+              'lines_in', 'lines_out', 'bytes_in', 'bytes_out')
+
+    def __init__(self, args, kind):
+        for field in self.FIELDS:
+            setattr(self, field, None)
+        self.args = args
+        self.kind = kind
+        self._started = time.perf_counter()
+
+    def finish(self, retcode, rusage=None):
+        """ Records the end of the stage """
+        self.wall = time.perf_counter() - self._started
+        self.retcode = retcode
+        if rusage is not None:
+            self.user = rusage.ru_utime
+            self.sys = rusage.ru_stime
+            self.maxrss = _maxrss_bytes(rusage)
+
+    @property
+    def cpu(self):
+        """ User and system CPU time, or None if not measured """
+        if self.user is None:
+            return None
+        return self.user + (self.sys or 0)
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    def __repr__(self):
+        return '{}({})'.format(self.__class__.__name__, ', '.join(
+            '{}={!r}'.format(field, getattr(self, field))
+            for field in self.FIELDS if getattr(self, field) is not None))
+
+
+class PipelineStats():
+    """ Statistics of one pipeline run, with the stages in data flow
+    order. Available as the stats attribute of the executed
+    PypeComponent, and of the RetcodeException if the run failed. """
+    def __init__(self, stages, wall=None):
+        self.stages = stages
+        self.wall = wall
+        self._infer_neighbours()
+
+    def _infer_neighbours(self):
+        """ Stages connected by a pipe see the same data """
+        for upstream, downstream in zip(self.stages, self.stages[1:]):
+            for out, inp in (('lines_out', 'lines_in'),
+                             ('bytes_out', 'bytes_in')):
+                if getattr(upstream, out) is None:
+                    setattr(upstream, out, getattr(downstream, inp))
+                elif getattr(downstream, inp) is None:
+                    setattr(downstream, inp, getattr(upstream, out))
+
+    def bottleneck(self):
+        """ The stage that used the most CPU time """
+        measured = [stage for stage in self.stages if stage.cpu is not None]
+        if len(measured) == 0:
+            return None
+        return max(measured, key=lambda stage: stage.cpu)
+
+    def to_dict(self):
+        return {
+            'wall': self.wall,
+            'stages': [stage.to_dict() for stage in self.stages],
+        }
+
+    def to_json(self, **kwargs):
+        # imported here, as only needed for exporting
+        import json
+        return json.dumps(self.to_dict(), **kwargs)
+
+    def __repr__(self):
+        return '{}(wall={!r}, stages={!r})'.format(
+            self.__class__.__name__, self.wall, self.stages)
+
+
+def to_json(stats, **kwargs):
+    """ Exports a PipelineStats, or a list of them (e.g. Parallel.stats),
+    as JSON. Pipelines that have not finished are null. """
+    if isinstance(stats, PipelineStats):
+        return stats.to_json(**kwargs)
+    import json
+    return json.dumps(
+        [None if pipe is None else pipe.to_dict() for pipe in stats],
+        **kwargs)
+
+
+def thread_rusage():
+    """ Resource usage of the calling thread, or None if unsupported """
+    if resource is None or not hasattr(resource, 'RUSAGE_THREAD'):
+        return None
+    return resource.getrusage(resource.RUSAGE_THREAD)
+
+
+def wait_with_rusage(proc):
+    """ Waits for a subprocess.Popen like wait(),
+    returning the return code and the resource usage of the child.
+    The resource usage is None if the child was already reaped. """
+    if proc.returncode is not None or not hasattr(os, 'wait4'):
+        return proc.wait(), None
+    try:
+        _, status, rusage = os.wait4(proc.pid, 0)
+    except ChildProcessError:
+        # reaped elsewhere, e.g. by poll in another thread
+        return proc.wait(), None
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    return proc.returncode, rusage
@@ -1,4 +1,8 @@
-""" Standard Commands for boilerplate reduction """
+""" Standard Commands for boilerplate reduction.
+
+The Commands are created on first use, so that importing this module
+stays fast. Their executables are looked up only when a pipeline
+using them starts (see PypeComponent.check_executables). """
 # C0103 Constant name in UPPER_CASE: uppercase is tedious for scripting
 # W0611 unused-import: renaming import for easy "from pypedream.std import *"
 # pylint: disable=C0103,W0611
@@ -8,42 +12,62 @@ from .pypedream import Command as C
 from .pypedream import Function as F
 
 
-### some standard executables
-amixer = C('amixer')
-aplay = C('aplay')
-apt = C('apt')
-apt_add_repository = C('apt-add-repository')
-apt_config = C('apt-config')
-apt_get = C('apt-get')
-aptitude = C('aptitude')
-apt_key = C('apt-key')
-aspell = C('aspell')
-at = C('at')
-atools = C('atools')
-autoconf = C('autoconf')
-automake = C('automake')
-awk = C('awk')
-
-base32 = C('base32')
-base64 = C('base64')
-bibtex = C('bibtex')
-bzcat = C('bzcat')
-bzdiff = C('bzdiff')
-bzegrep = C('bzegrep')
-bzfgrep = C('bzfgrep')
-bzgrep = C('bzgrep')
-bzip2 = C('bzip2')
-bzless = C('bzless')
-
-cal = C('cal')
-chgrp = C('chgrp')
-chmod = C('chmod')
-chown = C('chown')
-clang = C('clang')
-cmake = C('cmake')
-cmp_ = C('cmp')
-cp = C('cp')
-cpp = C('cpp')
-curl = C('curl')
-cut = C('cut')
-cython = C('cython')
+### some standard executables, by attribute name
+EXECUTABLES = {
+    'amixer': 'amixer',
+    'aplay': 'aplay',
+    'apt': 'apt',
+    'apt_add_repository': 'apt-add-repository',
+    'apt_config': 'apt-config',
+    'apt_get': 'apt-get',
+    'aptitude': 'aptitude',
+    'apt_key': 'apt-key',
+    'aspell': 'aspell',
+    'at': 'at',
+    'atools': 'atools',
+    'autoconf': 'autoconf',
+    'automake': 'automake',
+    'awk': 'awk',
+
+    'base32': 'base32',
+    'base64': 'base64',
+    'bibtex': 'bibtex',
+    'bzcat': 'bzcat',
+    'bzdiff': 'bzdiff',
+    'bzegrep': 'bzegrep',
+    'bzfgrep': 'bzfgrep',
+    'bzgrep': 'bzgrep',
+    'bzip2': 'bzip2',
+    'bzless': 'bzless',
+
+    'cal': 'cal',
+    'chgrp': 'chgrp',
+    'chmod': 'chmod',
+    'chown': 'chown',
+    'clang': 'clang',
+    'cmake': 'cmake',
+    'cmp_': 'cmp',
+    'cp': 'cp',
+    'cpp': 'cpp',
+    'curl': 'curl',
+    'cut': 'cut',
+    'cython': 'cython',
+}
+
+__all__ = ['C', 'F'] + list(EXECUTABLES)
+
+
+def __getattr__(name):
+    try:
+        executable = EXECUTABLES[name]
+    except KeyError:
+        raise AttributeError(
+            'module {!r} has no attribute {!r}'.format(__name__, name))
+    command = C(executable)
+    # later lookups find the Command directly
+    globals()[name] = command
+    return command
+
+
+def __dir__():
+    return __all__
@@ -0,0 +1,5 @@
+import os
+
+# the directory containing the package, for running scripts using it
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))))
@@ -0,0 +1,102 @@
+import pickle
+
+import pytest
+
+import pypedream as pyd
+
+numpy = pytest.importorskip('numpy')
+
+from pypedream.arrays import ArrayBlocks  # noqa: E402
+
+
+def run(pype, text):
+    capture = pyd.Capture()
+    pyd.Literal(text) >> pype >> capture
+    return capture.text()
+
+
+def product_and_sum(x, y):
+    return x * y, x + y
+
+
+def scale(x):
+    return x * 10
+
+
+def block_sizes(x):
+    return numpy.full(len(x), len(x))
+
+
+def test_whitespace_fast_path():
+    pype = pyd.ArrayFunction(product_and_sum, fmt='%g')
+    assert run(pype, '1\t2\n3\t4\n') == '2\t3\n12\t7\n'
+    pype = pyd.ArrayFunction(
+        product_and_sum, delimiter=' ', dtype=int, fmt='%d')
+    assert run(pype, '1 2\n3 4\n') == '2 3\n12 7\n'
+
+
+def test_2d_result():
+    pype = pyd.ArrayFunction(
+        lambda x, y: numpy.stack([y, x], axis=1), dtype=int)
+    assert run(pype, '1\t2\n3\t4\n') == '2\t1\n4\t3\n'
+
+
+def test_per_column_dtypes():
+    pype = pyd.ArrayFunction(
+        lambda name, count: (name, count * 2), dtype=[str, int])
+    assert run(pype, 'a\t1\nb\t2\n') == 'a\t2\nb\t4\n'
+
+
+def test_str_dtype():
+    pype = pyd.ArrayFunction(numpy.char.upper, dtype=str)
+    assert run(pype, 'a\nb c\n') == 'A\nB C\n'
+
+
+def test_fields_containing_spaces():
+    pype = pyd.ArrayFunction(
+        lambda name, count: (name, count * 2), dtype=[str, int])
+    assert run(pype, 'a b\t1\nc\t2\n') == 'a b\t2\nc\t4\n'
+    # split on spaces too, this would parse as two full rows
+    with pytest.raises(ValueError):
+        ArrayBlocks(scale).parse(['1 2\t3\n', '4\n'])
+
+
+def test_other_delimiter():
+    pype = pyd.ArrayFunction(
+        product_and_sum, delimiter=',', dtype=int, fmt=['%d', '%03d'])
+    assert run(pype, '1,2\n3,4\n') == '2,003\n12,007\n'
+
+
+def test_blocks():
+    pype = pyd.ArrayFunction(block_sizes, block_size=3, dtype=int)
+    text = ''.join('{}\n'.format(i) for i in range(10))
+    assert run(pype, text).split() == ['3'] * 9 + ['1']
+
+
+def test_column_count_mismatch():
+    blocks = ArrayBlocks(scale, dtype=float)
+    with pytest.raises(ValueError, match='Expected 2 columns'):
+        blocks.parse(['1\t2\n', '3\n'])
+
+
+# the thread running the Function also reports the error
+@pytest.mark.filterwarnings(
+    'ignore::pytest.PytestUnhandledThreadExceptionWarning')
+def test_column_count_mismatch_fails_pipeline():
+    with pytest.raises(pyd.RetcodeException):
+        run(pyd.ArrayFunction(product_and_sum), '1\t2\n3\n')
+
+
+def test_pickle():
+    blocks = pickle.loads(pickle.dumps(
+        ArrayBlocks(scale, dtype=int, delimiter=',', fmt='%d')))
+    assert blocks.func is scale
+    assert blocks.__code__ is scale.__code__
+    assert (blocks.dtype, blocks.delimiter, blocks.fmt) == (int, ',', '%d')
+
+
+def test_processes():
+    pype = pyd.ArrayFunction(
+        scale, block_size=7, dtype=int, processes=2, fmt='%d')
+    text = ''.join('{}\n'.format(i) for i in range(100))
+    assert run(pype, text).split() == [str(10 * i) for i in range(100)]
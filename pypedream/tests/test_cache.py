@@ -0,0 +1,115 @@
+import threading
+
+import pypedream as pyd
+from pypedream.cache import function_identity
+
+
+def make(n):
+    def append(line):
+        return line.rstrip('\n') + str(n) + '\n'
+    return lambda lines: map(append, lines)
+
+
+class Suffix():
+    def __init__(self, suffix):
+        self.suffix = suffix
+
+    def apply(self, lines):
+        for line in lines:
+            yield line.rstrip('\n') + self.suffix + '\n'
+
+
+def identity(func, **kwargs):
+    return function_identity(pyd.Function(func, **kwargs).commands[0])
+
+
+def run(pype, input, output):
+    if output.exists():
+        output.unlink()
+    return input >> pype >> output
+
+
+def test_hit_and_miss(tmp_path):
+    cache = pyd.ResultCache(tmp_path / 'cache')
+    input = tmp_path / 'in.txt'
+    input.write_text('a\nb\n')
+    output = tmp_path / 'out.txt'
+    pype = (pyd.Command('sort -r') | pyd.Function(make(1))).configure(
+        cache=cache)
+    assert not run(pype, input, output).execution.cached
+    assert output.read_text() == 'b1\na1\n'
+    assert run(pype, input, output).execution.cached
+    assert output.read_text() == 'b1\na1\n'
+    # a changed input is a miss
+    input.write_text('c\n')
+    assert not run(pype, input, output).execution.cached
+    assert output.read_text() == 'c1\n'
+
+
+def test_closure_values_in_key(tmp_path):
+    cache = pyd.ResultCache(tmp_path / 'cache')
+    output = tmp_path / 'out.txt'
+    for n in (1, 2):
+        pype = (pyd.Command('echo x') | pyd.Function(make(n))).configure(
+            cache=cache)
+        assert not run(pype, None, output).execution.cached
+        assert output.read_text() == 'x{}\n'.format(n)
+
+
+def test_identity_of_captured_values():
+    assert identity(make(1)) == identity(make(1))
+    assert identity(make(1)) != identity(make(2))
+
+    def with_default(lines, n=1):
+        return lines
+    first = identity(with_default)
+    with_default.__defaults__ = (2,)
+    assert identity(with_default) != first
+
+    assert identity(Suffix('a').apply) == identity(Suffix('a').apply)
+    assert identity(Suffix('a').apply) != identity(Suffix('b').apply)
+
+
+def test_unidentifiable_values():
+    lock = threading.Lock()
+
+    def locked(lines):
+        with lock:
+            return lines
+    assert identity(locked) is None
+    # unless the version stands for them
+    assert identity(locked, version='1') is not None
+
+
+THRESHOLD = 0
+
+
+def above_threshold(lines):
+    return (line for line in lines if int(line) > THRESHOLD)
+
+
+def test_global_values_in_key(tmp_path):
+    global THRESHOLD
+    cache = pyd.ResultCache(tmp_path / 'cache')
+    output = tmp_path / 'out.txt'
+    pype = (pyd.Command('printf "1\\n5\\n9\\n"')
+            | pyd.Function(above_threshold)).configure(cache=cache)
+    try:
+        assert not run(pype, None, output).execution.cached
+        assert output.read_text().split() == ['1', '5', '9']
+        THRESHOLD = 6
+        assert not run(pype, None, output).execution.cached
+        assert output.read_text().split() == ['9']
+    finally:
+        THRESHOLD = 0
+
+
+UNHASHABLE = threading.Lock()
+
+
+def test_unidentifiable_globals():
+    def locked(lines):
+        with UNHASHABLE:
+            return lines
+    assert identity(locked) is None
+    assert identity(locked, version='1') is not None
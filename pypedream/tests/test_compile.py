@@ -0,0 +1,88 @@
+import asyncio
+
+import pytest
+
+import pypedream as pyd
+
+
+def upper(lines):
+    for line in lines:
+        yield line.upper()
+
+
+@pytest.fixture
+def inputs(tmp_path):
+    paths = []
+    for i in range(3):
+        path = tmp_path / 'in{}.txt'.format(i)
+        path.write_text('b{0}\na{0}\n'.format(i))
+        paths.append(path)
+    return paths
+
+
+def test_run_many(inputs):
+    plan = (pyd.Command('sort') | pyd.Function(upper)).compile()
+    assert all(len(argv) > 0 and argv[0].startswith('/')
+               for argv in plan.argv.values())
+    for i, path in enumerate(inputs):
+        output = path.with_suffix('.out')
+        execution = plan.run(path, output)
+        assert output.read_text() == 'A{0}\nB{0}\n'.format(i)
+        assert execution.stats is not None
+    capture = pyd.Capture()
+    plan.run(inputs[0], capture)
+    assert capture.text() == 'A0\nB0\n'
+
+
+def test_filled_endpoints(inputs, tmp_path):
+    output = tmp_path / 'out.txt'
+    plan = (pyd.Command('sort') << inputs[1]).compile()
+    plan.run(output=output)
+    assert output.read_text() == 'a1\nb1\n'
+
+
+def test_missing_executable_at_compile_time():
+    pype = pyd.Command('cat') | pyd.Command('no-such-executable-pypedream')
+    with pytest.raises(pyd.MissingExecutableException):
+        pype.compile()
+
+
+def test_failure(inputs):
+    plan = pyd.Command('sh -c "cat; exit 3"').compile()
+    with pytest.raises(pyd.RetcodeException):
+        plan.run(inputs[0], None)
+
+
+def test_run_in_parallel(inputs):
+    plan = (pyd.Command('sort') | pyd.Function(upper)).compile()
+    parallel = pyd.Parallel(max_jobs=2)
+    with parallel as para:
+        for path in inputs:
+            plan.run(path, path.with_suffix('.out'), parallel=para)
+    assert len(parallel.pipelines) == len(inputs)
+    for i, path in enumerate(inputs):
+        assert path.with_suffix('.out').read_text() == \
+            'A{0}\nB{0}\n'.format(i)
+
+
+def test_run_async(inputs):
+    plan = (pyd.Command('sort') | pyd.Function(upper)).compile()
+
+    async def run_all():
+        return await asyncio.gather(*(
+            plan.run_async(path, path.with_suffix('.out'))
+            for path in inputs))
+    stats = asyncio.run(run_all())
+    assert len(stats) == len(inputs)
+    for i, path in enumerate(inputs):
+        assert path.with_suffix('.out').read_text() == \
+            'A{0}\nB{0}\n'.format(i)
+
+
+def test_async_engine(inputs):
+    plan = pyd.Command('sort').configure(engine='async').compile()
+    output = inputs[0].with_suffix('.out')
+    plan.run(inputs[0], output)
+    assert output.read_text() == 'a0\nb0\n'
+    with pytest.raises(Exception, match='can not be combined'):
+        plan.run(inputs[0], output, parallel=pyd.Parallel())
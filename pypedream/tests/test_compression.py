@@ -0,0 +1,91 @@
+import importlib.util
+import subprocess
+
+import pytest
+
+import pypedream as pyd
+from pypedream import compression
+
+TEXT = ''.join('line {}\n'.format(i) for i in range(10000))
+MAGIC = {
+    '.gz': b'\x1f\x8b',
+    '.bz2': b'BZh',
+    '.xz': b'\xfd7zXZ',
+    '.zst': b'\x28\xb5\x2f\xfd',
+}
+
+
+def available(suffix, method):
+    """ Skips the test if method can not (de)compress suffix """
+    codec = compression.CODECS[suffix]
+    external = codec.command('r') is not None \
+        and codec.command('a') is not None
+    python = importlib.util.find_spec(codec.module) is not None
+    if not {'external': external, 'python': python,
+            'auto': external or python}[method]:
+        pytest.skip('no {} support for {}'.format(method, suffix))
+
+
+@pytest.mark.parametrize('method', ['external', 'python', 'auto'])
+@pytest.mark.parametrize('suffix', sorted(MAGIC))
+def test_round_trip(suffix, method, tmp_path):
+    available(suffix, method)
+    path = tmp_path / ('out.txt' + suffix)
+    # Functions keep the pipelines off the descriptor-only path
+    pype = (pyd.Command('cat') | pyd.Function(lambda lines: lines)
+            | pyd.Command('cat')).configure(compression=method)
+    write = pyd.Literal(TEXT) >> pype >> path
+    assert path.read_bytes().startswith(MAGIC[suffix])
+    capture = pyd.Capture()
+    read = path >> pype >> capture
+    assert capture.text() == TEXT
+    for pipe in (write, read):
+        assert (len(pipe.execution.codecs) > 0) == (
+            method != 'python' and compression.CODECS[suffix].command('r')
+            is not None)
+
+
+@pytest.mark.parametrize('suffix', sorted(MAGIC))
+def test_descriptor_only(suffix, tmp_path):
+    available(suffix, 'external')
+    plain = tmp_path / 'plain.txt'
+    plain.write_text(TEXT)
+    path = tmp_path / ('out.txt' + suffix)
+    write = plain >> pyd.Command('cat') >> path
+    assert path.read_bytes().startswith(MAGIC[suffix])
+    copy = tmp_path / 'copy.txt'
+    read = path >> pyd.Command('cat') >> copy
+    assert copy.read_text() == TEXT
+    for pipe in (write, read):
+        # only subprocesses: the compression helper is a stage
+        assert all(isinstance(proc, subprocess.Popen)
+                   for proc in pipe.execution.processes
+                   + pipe.execution.codecs)
+        assert len(pipe.execution.codecs) == 1
+
+
+@pytest.mark.parametrize('functions', [False, True])
+def test_failed_helper_reported(functions, tmp_path):
+    available('.gz', 'external')
+    path = tmp_path / 'corrupt.gz'
+    path.write_bytes(b'not gzip\n')
+    pype = pyd.Command('cat')
+    if functions:
+        pype = pype | pyd.Function(lambda lines: lines)
+    with pytest.raises(pyd.RetcodeException) as info:
+        path >> pype.configure(compression='external') >> tmp_path / 'out'
+    helper = compression.CODECS['.gz'].command('r').split()
+    assert any(args[-len(helper):] == helper for args, _ in info.value.failed)
+
+
+def test_missing_helper(monkeypatch, tmp_path):
+    monkeypatch.setitem(compression.CODECS, '.fake', compression.Codec(
+        '.fake', 'gzip',
+        decompress=['no-such-unzip -dc'], compress=['no-such-zip -c']))
+    path = tmp_path / 'out.fake'
+    pype = pyd.Command('cat') | pyd.Function(lambda lines: lines)
+    with pytest.raises(Exception, match='No executable found'):
+        pyd.Literal(TEXT) >> pype.configure(compression='external') >> path
+    # auto falls back to the Python module
+    pyd.Literal(TEXT) >> pype.configure(compression='auto') >> path
+    assert path.read_bytes().startswith(MAGIC['.gz'])
@@ -0,0 +1,35 @@
+import pytest
+
+import pypedream as pyd
+
+
+def test_literal_to_capture():
+    capture = pyd.Capture()
+    pyd.Literal('b\na\n') >> pyd.Command('sort') >> capture
+    assert capture.text() == 'a\nb\n'
+    assert capture.getvalue() == b'a\nb\n'
+    assert len(capture) == 4
+
+
+def test_large_literal():
+    # more than fits into a pipe buffer
+    data = ''.join('{}\n'.format(i) for i in range(100000))
+    capture = pyd.Capture()
+    pyd.Literal(data) >> pyd.Command('cat') >> capture
+    assert capture.text() == data
+
+
+def test_literal_bytes_binary():
+    capture = pyd.Capture()
+    pyd.Literal(b'\x00\xff\n') >> pyd.Command('cat').configure(
+        binary=True) >> capture
+    assert capture.getvalue() == b'\x00\xff\n'
+
+
+def test_capture_max_size():
+    capture = pyd.Capture(max_size=2)
+    with pytest.raises(Exception):
+        capture.write(b'abc')
+    assert capture.getvalue() == b'ab'
+    capture.clear()
+    assert len(capture) == 0
@@ -0,0 +1,101 @@
+import asyncio
+import time
+
+import pytest
+
+import pypedream as pyd
+
+
+def upper(lines):
+    for line in lines:
+        yield line.upper()
+
+
+async def async_upper(lines):
+    async for line in lines:
+        yield line.upper()
+
+
+@pytest.mark.parametrize('options', [
+    {}, {'engine': 'async'}, {'launcher': 'spawn'},
+    {'function_threads': True}])
+def test_options(options, tmp_path):
+    output = tmp_path / 'out.txt'
+    pype = (pyd.Command('seq 1 3') | pyd.Command('sed s/^/x/')
+            | pyd.Function(upper)).configure(**options)
+    None >> pype >> output
+    assert output.read_text() == 'X1\nX2\nX3\n'
+
+
+def test_binary(tmp_path):
+    output = tmp_path / 'out.bin'
+    pype = pyd.Command('printf "\\377\\n"') | pyd.Command('cat')
+    None >> pype.configure(binary=True) >> output
+    assert output.read_bytes() == b'\xff\n'
+
+
+def test_async_function(tmp_path):
+    output = tmp_path / 'out.txt'
+    None >> (pyd.Command('printf "a\\nb\\n"')
+             | pyd.Function(async_upper)).configure(engine='async') >> output
+    assert output.read_text() == 'A\nB\n'
+
+
+def test_spawn_launcher_used():
+    pype = None >> pyd.Command('true').configure(launcher='spawn') >> None
+    assert isinstance(pype.execution.processes[0], pyd.SpawnedProcess)
+
+
+@pytest.mark.parametrize('engine', ['thread', 'async'])
+def test_capture_stderr(engine):
+    pype = pyd.Command('sh -c "echo oops >&2; exit 2"').configure(
+        capture_stderr=100, engine=engine)
+    with pytest.raises(pyd.RetcodeException) as info:
+        None >> pype >> None
+    assert info.value.failed[0].stderr == b'oops\n'
+    assert 'oops' in str(info.value)
+
+
+def test_missing_executable():
+    with pytest.raises(pyd.MissingExecutableException):
+        None >> pyd.Command('no-such-executable-pypedream') >> None
+
+
+class SlowSink():
+    def __init__(self):
+        self.data = b''
+
+    def write(self, data):
+        time.sleep(0.3)
+        self.data += data
+
+
+def slow_lines():
+    for i in range(3):
+        time.sleep(0.3)
+        yield '{}\n'.format(i)
+
+
+@pytest.mark.parametrize('slow', ['source', 'sink'])
+def test_slow_endpoint_does_not_block_loop(slow):
+    fast_output = pyd.Capture()
+    slow_sink = SlowSink()
+
+    async def main():
+        if slow == 'source':
+            input, output = slow_lines(), pyd.Capture()
+        else:
+            input, output = pyd.Literal('a\nb\n'), slow_sink
+        started = time.perf_counter()
+        # started first
+        slow_run = asyncio.ensure_future(
+            pyd.Function(async_upper).run_async(input, output))
+        await pyd.Function(async_upper).run_async(
+            pyd.Literal('x\n'), fast_output)
+        elapsed = time.perf_counter() - started
+        await slow_run
+        return elapsed
+    assert asyncio.run(main()) < 0.25
+    assert fast_output.text() == 'X\n'
+    if slow == 'sink':
+        assert slow_sink.data == b'A\nB\n'
@@ -0,0 +1,78 @@
+import os
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+import pypedream as pyd
+from . import ROOT
+
+
+def double(lines):
+    for line in lines:
+        yield str(2 * int(line)) + '\n'
+
+
+def double_batches(batches):
+    for batch in batches:
+        yield [str(2 * int(line)) + '\n' for line in batch]
+
+
+def run(pype, lines):
+    capture = pyd.Capture()
+    pyd.Literal(''.join(lines)) >> pype >> capture
+    return capture.text().splitlines(True)
+
+
+LINES = ['{}\n'.format(i) for i in range(5000)]
+EXPECTED = ['{}\n'.format(2 * i) for i in range(5000)]
+
+
+def test_function():
+    assert run(pyd.Function(double), LINES) == EXPECTED
+
+
+def test_batched():
+    assert run(pyd.Function(double_batches, batch=100), LINES) == EXPECTED
+
+
+@pytest.mark.parametrize('func, batch', [
+    (double, None), (double_batches, 100)])
+def test_processes(func, batch):
+    pype = pyd.Function(func, batch=batch, processes=2, chunk_size=300)
+    assert run(pype, LINES) == EXPECTED
+
+
+def test_processes_unordered():
+    pype = pyd.Function(double, processes=2, chunk_size=300, ordered=False)
+    assert sorted(run(pype, LINES)) == sorted(EXPECTED)
+
+
+def test_processes_in_tee_branch(tmp_path):
+    branch = tmp_path / 'branch.txt'
+    pype = pyd.Command('cat') | pyd.Tee(
+        pyd.Function(double, processes=2, chunk_size=300) >> branch)
+    assert run(pype, LINES) == LINES
+    assert branch.read_text().splitlines(True) == EXPECTED
+
+
+def test_processes_in_unguarded_script(tmp_path):
+    # the workers must not import the main script again
+    (tmp_path / 'script.py').write_text(textwrap.dedent("""
+        import pypedream as pyd
+
+        def double(lines):
+            for line in lines:
+                yield str(2 * int(line)) + '\\n'
+
+        None >> pyd.Command('echo ran') >> 'log.txt'
+        pyd.Literal('1\\n2\\n3\\n') >> pyd.Function(
+            double, processes=2, chunk_size=1) >> 'out.txt'
+        """))
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    result = subprocess.run(
+        [sys.executable, 'script.py'], cwd=tmp_path, env=env, timeout=60)
+    assert result.returncode == 0
+    assert (tmp_path / 'log.txt').read_text() == 'ran\n'
+    assert (tmp_path / 'out.txt').read_text() == '2\n4\n6\n'
@@ -0,0 +1,99 @@
+import os
+
+import pytest
+
+import pypedream as pyd
+
+
+@pytest.fixture
+def files(tmp_path):
+    paths = {name: tmp_path / '{}.txt'.format(name) for name in 'abcd'}
+    paths['a'].write_text('1 2\n')
+    return paths
+
+
+def build(files, force=False):
+    """ a -> b -> c, and b -> d """
+    graph = pyd.Graph(force=force)
+    with graph as g:
+        # slow, so that a missing dependency would read an empty b
+        files['a'] >> pyd.Command(
+            'sh -c \'sleep 0.2; tr " " "\\n"\'') & g >> files['b']
+        files['b'] >> pyd.Command('sort -r') & g >> files['c']
+        files['b'] >> pyd.Command('wc -l') & g >> files['d']
+    return graph
+
+
+def make_stale(path):
+    """ Makes path newer than all outputs """
+    future = os.stat(path).st_mtime_ns + 10**10
+    os.utime(path, ns=(future, future))
+
+
+def test_dependency_order(files):
+    graph = build(files)
+    assert files['b'].read_text() == '1\n2\n'
+    assert files['c'].read_text() == '2\n1\n'
+    assert files['d'].read_text().split() == ['2']
+    assert graph.up_to_date == []
+
+
+def test_up_to_date_skipped(files):
+    build(files)
+    graph = build(files)
+    assert graph.up_to_date == graph.pipelines
+    assert files['c'].read_text() == '2\n1\n'
+
+
+def test_stale_rebuilt(files):
+    build(files)
+    files['a'].write_text('3 4\n')
+    make_stale(files['a'])
+    graph = build(files)
+    assert graph.up_to_date == []
+    # replaced rather than appended to
+    assert files['b'].read_text() == '3\n4\n'
+    assert files['c'].read_text() == '4\n3\n'
+    assert files['d'].read_text().split() == ['2']
+
+
+def test_only_stale_rebuilt(files):
+    build(files)
+    make_stale(files['b'])
+    graph = build(files)
+    first, second, third = graph.pipelines
+    assert graph.up_to_date == [first]
+    assert files['c'].read_text() == '2\n1\n'
+
+
+def test_force(files):
+    build(files)
+    graph = build(files, force=True)
+    assert graph.up_to_date == []
+    assert files['b'].read_text() == '1\n2\n'
+
+
+def test_tee_outputs_replaced(files, tmp_path):
+    branch = tmp_path / 'branch.txt'
+    branch.write_text('stale\n')
+    pype = pyd.Command('cat') | pyd.Tee(pyd.Command('cat') >> branch)
+    with pyd.Graph(force=True) as g:
+        files['a'] >> pype & g >> files['b']
+    assert branch.read_text() == '1 2\n'
+    assert files['b'].read_text() == '1 2\n'
+
+
+def test_failure(files):
+    graph = pyd.Graph()
+    with pytest.raises(pyd.RetcodeException):
+        with graph as g:
+            files['a'] >> pyd.Command('sh -c "cat; exit 1"') & g >> files['b']
+            files['b'] >> pyd.Command('sort -r') & g >> files['c']
+            files['a'] >> pyd.Command('cat') & g >> files['d']
+    first, second, third = graph.pipelines
+    assert first.exception is not None
+    assert graph.not_run == [second]
+    # the partial output is removed, so that it is rebuilt next time
+    assert not files['b'].exists()
+    assert not files['c'].exists()
+    assert files['d'].read_text() == '1 2\n'
@@ -0,0 +1,25 @@
+import subprocess
+import sys
+
+from . import ROOT
+
+# modules only needed by some pipelines
+LAZY_MODULES = ('heapq', 'json', 'locale', 'queue', 'shutil',
+                'pypedream.arrays', 'pypedream.cache',
+                'pypedream.compression', 'pypedream.records')
+
+
+def test_import_is_lazy():
+    script = ('import sys, pypedream, pypedream.std\n'
+              'print(" ".join(m for m in {!r} if m in sys.modules))'.format(
+                  LAZY_MODULES))
+    result = subprocess.run(
+        [sys.executable, '-c', script], cwd=ROOT,
+        stdout=subprocess.PIPE, universal_newlines=True, timeout=30)
+    assert result.stdout.split() == []
+
+
+def test_lazy_names():
+    import pypedream as pyd
+    from pypedream.cache import ResultCache
+    assert pyd.ResultCache is ResultCache
@@ -0,0 +1,53 @@
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+import pypedream as pyd
+from . import ROOT
+
+
+def test_exhausted():
+    lines = None >> pyd.Command('seq 1 5') >> pyd.ITER
+    assert list(lines) == ['1\n', '2\n', '3\n', '4\n', '5\n']
+    assert lines.exception is None
+    assert lines.stats is not None
+
+
+def test_exhausted_failure_raises():
+    lines = None >> pyd.Command('sh -c "echo a; exit 3"') >> pyd.ITER
+    with pytest.raises(pyd.RetcodeException):
+        list(lines)
+
+
+def test_early_exit_stops_pipeline():
+    lines = None >> pyd.Command('seq 1 1000000') >> pyd.ITER
+    for i, _ in enumerate(lines):
+        if i > 3:
+            break
+    lines.close()
+    assert lines.stats is not None
+
+
+def test_close_before_iterating():
+    with (None >> pyd.Command('seq 1 1000000') >> pyd.ITER) as lines:
+        pass
+    assert lines.stats is not None
+
+
+def test_early_exit_at_module_level_exits():
+    # the generator is then finalized at interpreter shutdown
+    script = textwrap.dedent("""
+        import pypedream as pyd
+        it = None >> pyd.Command('seq 1 1000000') >> pyd.ITER
+        for i, l in enumerate(it):
+            if i > 3:
+                break
+        print('done')
+        """)
+    result = subprocess.run(
+        [sys.executable, '-c', script], cwd=ROOT,
+        stdout=subprocess.PIPE, timeout=30)
+    assert result.returncode == 0
+    assert result.stdout == b'done\n'
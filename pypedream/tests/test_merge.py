@@ -0,0 +1,48 @@
+import pytest
+
+import pypedream as pyd
+
+
+def run(source, pype=None):
+    capture = pyd.Capture()
+    source >> (pype or pyd.Command('cat')) >> capture
+    return capture.text()
+
+
+@pytest.fixture
+def files(tmp_path):
+    a = tmp_path / 'a.txt'
+    b = tmp_path / 'b.txt'
+    a.write_text('1\n3\n5\n')
+    b.write_text('2\n4\n6\n')
+    return a, b
+
+
+def test_concat(files):
+    a, b = files
+    merged = pyd.Merge(a, pyd.Command('cat') << b)
+    assert run(merged) == '1\n3\n5\n2\n4\n6\n'
+
+
+def test_sorted(files):
+    a, b = files
+    merged = pyd.Merge(a, b, mode='sorted', key=int)
+    assert run(merged) == '1\n2\n3\n4\n5\n6\n'
+
+
+def test_interleave(files):
+    a, b = files
+    merged = pyd.Merge(a, b, mode='interleave')
+    lines = run(merged).split()
+    assert sorted(lines, key=int) == [str(i) for i in range(1, 7)]
+
+
+# the thread reading the Merge also reports the failure
+@pytest.mark.filterwarnings(
+    'ignore::pytest.PytestUnhandledThreadExceptionWarning')
+def test_failing_source_fails_pipeline(files):
+    a, _ = files
+    merged = pyd.Merge(a, pyd.Command('sh -c "echo x; exit 4"'))
+    with pytest.raises(pyd.RetcodeException) as info:
+        run(merged)
+    assert (['sh', '-c', 'echo x; exit 4'], 4) in info.value.failed
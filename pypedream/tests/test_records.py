@@ -0,0 +1,27 @@
+import pytest
+
+import pypedream as pyd
+
+
+def total(records):
+    for name, count in records:
+        yield [name, int(count) * 2]
+
+
+@pytest.mark.parametrize('codec, text, expected', [
+    ('tsv', 'a\t1\nb\t2\n', 'a\t2\nb\t4\n'),
+    ('csv', 'a,1\n"b,c",2\n', 'a,2\n"b,c",4\n'),
+    ('jsonl', '["a", 1]\n["b", 2]\n', '["a", 2]\n["b", 4]\n'),
+])
+def test_codecs(codec, text, expected):
+    capture = pyd.Capture()
+    pype = (pyd.Command('cat') | pyd.Function(total)).configure(
+        records=codec)
+    pyd.Literal(text) >> pype >> capture
+    assert capture.text() == expected
+
+
+def test_unknown_codec():
+    with pytest.raises(Exception, match='Unknown record codec'):
+        pyd.Literal('a\n') >> pyd.Function(total).configure(
+            records='nope') >> pyd.Capture()
@@ -0,0 +1,98 @@
+import os
+
+import pytest
+
+import pypedream as pyd
+
+REPORT = "sh -c 'nice; ulimit -n'"
+
+
+def report(pype):
+    capture = pyd.Capture()
+    None >> pype >> capture
+    return capture.text().split()
+
+
+def test_pipeline_options():
+    pype = pyd.Command(REPORT).configure(nice=3, rlimits={'nofile': 100})
+    assert report(pype) == ['3', '100']
+
+
+def test_applied_before_exec():
+    # a short command must not finish before the options take effect
+    for _ in range(20):
+        pype = pyd.Command(REPORT).configure(nice=5, rlimits={'nofile': 100})
+        assert report(pype) == ['5', '100']
+
+
+def test_limit_tuples_and_constants():
+    import resource
+    pype = pyd.Command("sh -c 'ulimit -Sn; ulimit -Hn'").configure(
+        rlimits={resource.RLIMIT_NOFILE: (50, 60)})
+    assert report(pype) == ['50', '60']
+    with pytest.raises(Exception, match='Unknown resource limit'):
+        None >> pyd.Command('true', rlimits={'bogus': 1}) >> None
+
+
+def test_reported_args_without_prefix():
+    pype = pyd.Command('sh -c "exit 4"', nice=1)
+    with pytest.raises(pyd.RetcodeException) as info:
+        None >> pype >> None
+    assert info.value.failed == [(['sh', '-c', 'exit 4'], 4)]
+
+
+def test_command_options_override_pipeline():
+    pype = (pyd.Command(REPORT, nice=5) | pyd.Command('cat')).configure(
+        nice=1, rlimits={'nofile': 77})
+    assert report(pype) == ['5', '77']
+
+
+def test_command_options_kept_by_format():
+    pype = pyd.Command("sh -c '{}'", nice=2).format('nice')
+    assert report(pype) == ['2']
+
+
+def test_merge_unhashable_options():
+    pype = pyd.Command('cat').configure(
+        rlimits={'nofile': 100}, affinity={0}) | pyd.Command('cat')
+    pype = pype | pyd.Command('cat').configure(rlimits={'nofile': 100})
+    assert pype.options == {'rlimits': {'nofile': 100}, 'affinity': {0}}
+    with pytest.raises(Exception, match='two separate values'):
+        pype | pyd.Command('cat').configure(rlimits={'nofile': 50})
+
+
+def test_spawn_launcher_kept():
+    pype = pyd.Command(REPORT, nice=4, rlimits={'nofile': 99}).configure(
+        launcher='spawn')
+    capture = pyd.Capture()
+    pype = None >> pype >> capture
+    assert capture.text().split() == ['4', '99']
+    assert isinstance(pype.execution.processes[0], pyd.SpawnedProcess)
+
+
+def test_async_engine():
+    pype = pyd.Command(REPORT, nice=6).configure(engine='async')
+    assert report(pype)[0] == '6'
+
+
+@pytest.mark.skipif(not hasattr(os, 'sched_getaffinity'),
+                    reason='no CPU affinity')
+def test_affinity():
+    cpu = min(os.sched_getaffinity(0))
+    capture = pyd.Capture()
+    None >> pyd.Command(
+        'grep Cpus_allowed_list /proc/self/status',
+        affinity={cpu}) >> capture
+    assert capture.text().split()[-1] == str(cpu)
+
+
+@pytest.mark.skipif(not hasattr(os, 'sched_getaffinity'),
+                    reason='no CPU affinity')
+def test_parallel_spread():
+    parallel = pyd.Parallel(max_jobs=2, spread=True)
+    with parallel as para:
+        for _ in range(3):
+            None >> pyd.Command('true') & para >> None
+    for pipe in parallel.pipelines:
+        assert len(pipe.cpus) > 0
+        assert set(pipe.cpus) <= os.sched_getaffinity(0)
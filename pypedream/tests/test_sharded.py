@@ -0,0 +1,40 @@
+import pytest
+
+import pypedream as pyd
+
+N_LINES = 10000
+
+
+@pytest.fixture
+def numbers(tmp_path):
+    path = tmp_path / 'numbers.txt'
+    path.write_text(''.join('{}\n'.format(i) for i in range(N_LINES)))
+    return path
+
+
+def test_ranges_cover_file(numbers):
+    ranges = pyd.Sharded(numbers, jobs=4).ranges()
+    assert len(ranges) == 4
+    assert ranges[0][0] == 0
+    assert ranges[-1][1] == numbers.stat().st_size
+    for (_, end), (start, _) in zip(ranges, ranges[1:]):
+        assert end == start
+    text = numbers.read_bytes()
+    for start, _ in ranges[1:]:
+        # shards start at line boundaries
+        assert text[start - 1:start] == b'\n'
+
+
+@pytest.mark.parametrize('jobs', [1, 3, 8])
+def test_concatenated_in_shard_order(numbers, tmp_path, jobs):
+    output = tmp_path / 'out.txt'
+    pyd.Sharded(numbers, jobs=jobs) >> pyd.Command(
+        "awk '{print $1 * 2}'") | pyd.Function(lambda lines: lines) >> output
+    assert output.read_text().split() == [
+        str(2 * i) for i in range(N_LINES)]
+
+
+def test_failing_shard(numbers, tmp_path):
+    with pytest.raises(pyd.RetcodeException):
+        pyd.Sharded(numbers, jobs=2) >> pyd.Command(
+            'sh -c "cat; exit 5"') >> tmp_path / 'out.txt'
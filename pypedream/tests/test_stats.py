@@ -0,0 +1,66 @@
+import json
+import sys
+
+import pytest
+
+import pypedream as pyd
+from pypedream.stats import to_json
+
+# allocates 64 MiB, and spends some CPU time
+BUSY = '{} -c "b = bytearray(64 << 20); sum(range(3000000))"'.format(
+    sys.executable)
+
+
+def drop_b(lines):
+    return (line for line in lines if line != 'b\n')
+
+
+def test_command_rusage():
+    pype = None >> pyd.Command(BUSY) >> None
+    stage, = pype.stats.stages
+    assert (stage.kind, stage.retcode) == ('command', 0)
+    assert stage.maxrss >= 64 << 20
+    assert stage.cpu > 0
+    assert stage.wall > 0
+    assert pype.stats.bottleneck() is stage
+
+
+def test_counts_propagated(tmp_path):
+    input = tmp_path / 'in.txt'
+    input.write_text('a\nb\nc\n')
+    pype = input >> (pyd.Command('cat') | pyd.Function(drop_b)
+                     | pyd.Command('cat')) >> tmp_path / 'out.txt'
+    first, function, last = pype.stats.stages
+    assert function.kind == 'python'
+    assert function.maxrss is None
+    assert (function.lines_in, function.lines_out) == (3, 2)
+    # taken from the Function, and the sizes of the file endpoints
+    assert (first.bytes_in, first.lines_out) == (6, 3)
+    assert (last.lines_in, last.bytes_out) == (2, 4)
+
+
+def test_failed_run_has_stats():
+    with pytest.raises(pyd.RetcodeException) as info:
+        None >> pyd.Command('sh -c "exit 2"') >> None
+    assert info.value.stats.stages[0].retcode == 2
+
+
+def test_parallel_stats():
+    parallel = pyd.Parallel()
+    with parallel as para:
+        None >> pyd.Command('true') & para >> None
+        None >> pyd.Command(BUSY) & para >> None
+    stats = parallel.stats
+    assert len(stats) == 2
+    assert all(isinstance(pipe, pyd.PipelineStats) for pipe in stats)
+    assert stats[1].stages[0].maxrss >= 64 << 20
+
+
+def test_to_json():
+    pype = None >> (pyd.Command('echo a') | pyd.Function(drop_b)) >> None
+    exported = json.loads(pype.stats.to_json())
+    assert exported['wall'] == pype.stats.wall
+    assert [stage['kind'] for stage in exported['stages']] == [
+        'command', 'python']
+    assert exported['stages'][0]['args'] == ['echo', 'a']
+    assert json.loads(to_json([pype.stats, None])) == [exported, None]
@@ -0,0 +1,90 @@
+import time
+
+import pytest
+
+import pypedream as pyd
+
+FAIL = 'sh -c "exit 3"'
+# well below the sleeps, and above TERMINATE_GRACE
+LIMIT = 10
+
+
+@pytest.fixture
+def elapsed():
+    started = time.perf_counter()
+    yield lambda: time.perf_counter() - started
+
+
+def test_fail_fast(elapsed):
+    pype = (pyd.Command('sleep 30') | pyd.Command(FAIL)).configure(
+        fail_fast=True)
+    with pytest.raises(pyd.RetcodeException) as info:
+        None >> pype >> None
+    assert elapsed() < LIMIT
+    assert (['sh', '-c', 'exit 3'], 3) in info.value.failed
+
+
+# the Function thread also reports its broken pipe
+@pytest.mark.filterwarnings(
+    'ignore::pytest.PytestUnhandledThreadExceptionWarning')
+def test_fail_fast_python_stage(elapsed):
+    pype = (pyd.Command('yes') | pyd.Function(lambda lines: lines)
+            | pyd.Command('sh -c "sleep 0.2; exit 3"')).configure(
+                fail_fast=True)
+    with pytest.raises(pyd.RetcodeException):
+        None >> pype >> None
+    assert elapsed() < LIMIT
+
+
+def test_timeout(elapsed):
+    with pytest.raises(pyd.TimeoutException) as info:
+        None >> pyd.Command('sleep 30').configure(timeout=0.5) >> None
+    assert elapsed() < LIMIT
+    assert info.value.timeout == 0.5
+
+
+@pytest.mark.parametrize('engine', ['thread', 'async'])
+def test_timeout_engines(elapsed, engine):
+    pype = pyd.Command('sleep 30').configure(timeout=0.5, engine=engine)
+    with pytest.raises(pyd.TimeoutException):
+        None >> pype >> None
+    assert elapsed() < LIMIT
+
+
+def test_no_failure():
+    pype = (pyd.Command('seq 1 3') | pyd.Command('cat')).configure(
+        fail_fast=True, timeout=30)
+    capture = pyd.Capture()
+    None >> pype >> capture
+    assert capture.text() == '1\n2\n3\n'
+
+
+def test_parallel_fail_fast(elapsed):
+    parallel = pyd.Parallel(fail_fast=True)
+    with pytest.raises(pyd.RetcodeException) as info:
+        with parallel as para:
+            None >> pyd.Command('sleep 30') & para >> None
+            None >> pyd.Command(FAIL) & para >> None
+    assert elapsed() < LIMIT
+    assert (['sh', '-c', 'exit 3'], 3) in info.value.failed
+
+
+def test_parallel_fail_fast_cancels_queued(elapsed):
+    parallel = pyd.Parallel(max_jobs=1, fail_fast=True)
+    with pytest.raises(pyd.RetcodeException):
+        with parallel as para:
+            None >> pyd.Command(FAIL) & para >> None
+            None >> pyd.Command('sleep 30') & para >> None
+            None >> pyd.Command('sleep 30') & para >> None
+    assert elapsed() < LIMIT
+    assert len(parallel.cancelled) == 2
+
+
+def test_parallel_timeout(elapsed):
+    parallel = pyd.Parallel(max_jobs=1, timeout=0.5)
+    with pytest.raises(pyd.TimeoutException):
+        with parallel as para:
+            None >> pyd.Command('sleep 30') & para >> None
+            None >> pyd.Command('sleep 30') & para >> None
+    assert elapsed() < LIMIT
+    assert len(parallel.cancelled) == 1
@@ -0,0 +1,45 @@
+import pytest
+
+import pypedream as pyd
+
+N_LINES = 200000
+
+
+@pytest.fixture
+def numbers(tmp_path):
+    path = tmp_path / 'numbers.txt'
+    path.write_text(''.join('{}\n'.format(i) for i in range(N_LINES)))
+    return path
+
+
+def test_branches_get_copies(numbers, tmp_path):
+    branch = tmp_path / 'branch.txt'
+    output = tmp_path / 'out.txt'
+    numbers >> pyd.Command('cat') | pyd.Tee(
+        pyd.Command('wc -l') >> branch) >> output
+    assert output.read_text() == numbers.read_text()
+    assert branch.read_text().strip() == str(N_LINES)
+
+
+@pytest.mark.parametrize('functions', [False, True])
+def test_branch_finishing_early(numbers, tmp_path, functions):
+    branch = tmp_path / 'branch.txt'
+    output = tmp_path / 'out.txt'
+    pype = pyd.Command('cat') | pyd.Tee(pyd.Command('head -1') >> branch)
+    if functions:
+        # lines are copied by TeeTransform instead of the shovel
+        pype = pype | pyd.Function(lambda lines: lines)
+    numbers >> pype >> output
+    assert branch.read_text() == '0\n'
+    assert output.read_text() == numbers.read_text()
+
+
+# the thread running the Tee also reports the failure
+@pytest.mark.filterwarnings(
+    'ignore::pytest.PytestUnhandledThreadExceptionWarning')
+def test_failing_branch_fails_pipeline(numbers, tmp_path):
+    with pytest.raises(pyd.RetcodeException) as info:
+        numbers >> pyd.Command('cat') | pyd.Tee(
+            pyd.Command('sh -c "head -1; exit 2"') >> None) \
+            >> tmp_path / 'out.txt'
+    assert (['sh', '-c', 'head -1; exit 2'], 2) in info.value.failed